@@ -5,9 +5,14 @@ import streamlit as st
 
 sys.path.append(os.getcwd())
 
-from services import auth_service, firestore_service
+from services import auth_service, firestore_service, outbox_service, maintenance_service
 from utils import qr_code_util
 
+# Retoma o processamento de e-mails, SMS e logs pendentes de execuções anteriores.
+outbox_service.start_worker()
+# Verifica periodicamente os planos de manutenção de todos os gestores.
+maintenance_service.start_background_scheduler()
+
 st.set_page_config(page_title="Login - Checklist App", layout="wide")
 
 # --- CSS PARA OCULTAR A SIDEBAR ---
@@ -21,20 +26,26 @@ st.markdown("""
 
 
 def handle_login(email, password):
+    retry_after = auth_service.login_retry_after(email)
+    if retry_after:
+        st.error(f"Muitas tentativas de login para este e-mail. Tente novamente em {int(retry_after // 60) + 1} minuto(s).")
+        return
     user_record = auth_service.verify_user_password(email, password)
-    if user_record:
+    if user_record == auth_service.LOGIN_BUSY:
+        st.error("Muitos logins simultâneos no momento. Tente novamente em alguns segundos.")
+    elif user_record:
         st.session_state['pending_login_uid'] = user_record['uid']
+        # O registro lido na verificação da senha é reaproveitado no 2FA e na sessão.
+        st.session_state['pending_login_user'] = user_record
         st.session_state['flow'] = 'verify_2fa'
         st.rerun()
     else:
         st.error("Email ou senha inválidos.")
 
 def handle_2fa_verification(uid, code):
-    if auth_service.verify_totp_code(uid, code):
-        st.session_state['logged_in'] = True
-        st.session_state['user_uid'] = uid
-        st.session_state['user_data'] = firestore_service.get_user(uid)
-        st.session_state['flow'] = 'logged_in'
+    pending_user = st.session_state.get('pending_login_user')
+    if auth_service.verify_totp_code(uid, code, user_data=pending_user):
+        auth_service.start_session(pending_user or {**firestore_service.get_user(uid), 'uid': uid})
         st.rerun()
     else:
         st.error("Código 2FA inválido.")
@@ -66,6 +77,7 @@ def enable_2fa_flow():
             if auth_service.verify_totp_code_with_secret(secret, verification_code):
                 auth_service.enable_user_totp(uid, secret)
                 st.session_state.user_data['totp_enabled'] = True
+                auth_service.refresh_session_token(totp_enabled=True)
                 del st.session_state['totp_secret_temp']
                 st.success("2FA ativado com sucesso!")
                 st.session_state['flow'] = 'logged_in'
@@ -78,6 +90,9 @@ if 'flow' not in st.session_state:
 
 if st.session_state.get('logged_in') and st.session_state.get('flow') != 'logged_in':
     st.session_state['flow'] = 'logged_in'
+if st.session_state.get('flow') == 'logged_in' and not auth_service.get_session():
+    # Token expirado ou revogado: volta ao login.
+    auth_service.logout()
 
 with st.container():
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -112,19 +127,20 @@ with st.container():
             if not uid:
                 st.session_state['flow'] = 'login'
                 st.rerun()
-            if auth_service.is_totp_enabled(uid):
+            pending_user = st.session_state.get('pending_login_user')
+            if auth_service.is_totp_enabled(uid, user_data=pending_user):
                 st.title("Verificação de Dois Fatores")
                 code = st.text_input("Insira o código do seu app autenticador", max_chars=6)
                 if st.button("Verificar"):
                     handle_2fa_verification(uid, code)
             else:
-                st.session_state.update({'logged_in': True, 'user_uid': uid, 'user_data': firestore_service.get_user(uid), 'flow': 'logged_in'})
+                auth_service.start_session(pending_user or {**firestore_service.get_user(uid), 'uid': uid})
                 st.rerun()
 
         elif st.session_state['flow'] == 'logged_in':
             if 'redirected' not in st.session_state:
                 st.session_state['redirected'] = True
-                role = st.session_state.user_data.get('role')
+                role = auth_service.get_session().get('role')
                 if role == 'motorista': st.switch_page("pages/1_Painel_Motorista.py")
                 elif role == 'gestor': st.switch_page("pages/2_Painel_Gestor.py")
                 elif role == 'admin': st.switch_page("pages/3_Admin.py")
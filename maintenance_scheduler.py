@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Agendador de alertas de manutenção preventiva.
+
+Uso:
+    python maintenance_scheduler.py            # executa a cada 15 minutos
+    python maintenance_scheduler.py --once     # executa uma única verificação
+    python maintenance_scheduler.py --interval 600
+
+Os e-mails e logs gerados pelas verificações são gravados na fila de saída
+(data/outbox.sqlite3) e entregues pelos workers do app. Com --once, a fila é
+processada antes de encerrar.
+"""
+import sys
+import os
+import argparse
+
+sys.path.append(os.getcwd())
+
+from services import maintenance_service, outbox_service
+
+# Este processo apenas enfileira; não inicia workers concorrentes aos do app.
+outbox_service.AUTO_START_WORKER = False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica os planos de manutenção preventiva de todos os gestores.")
+    parser.add_argument("--once", action="store_true", help="Executa uma única verificação e encerra.")
+    parser.add_argument("--interval", type=int, default=maintenance_service.CHECK_INTERVAL_SECONDS, help="Intervalo entre verificações, em segundos.")
+    args = parser.parse_args()
+
+    if args.once:
+        results = maintenance_service.run_maintenance_check()
+        print(f"{sum(len(created) for created in results.values())} OS criada(s).")
+        # Processa os e-mails e logs enfileirados antes de encerrar.
+        while outbox_service.process_next_job():
+            pass
+    else:
+        maintenance_service.run_scheduler(args.interval)
@@ -6,20 +6,15 @@ from datetime import datetime
 
 sys.path.append(os.getcwd())
 
-from services import firestore_service, etrac_service, notification_service, auth_service, twilio_service, storage_service
-from utils import geo_util
+from services import firestore_service, etrac_service, auth_service, storage_service, fleet_cache, outbox_service
+from utils import geofence_util, image_util
 
 st.set_page_config(page_title="Painel Motorista", layout="wide")
 
 st.markdown("""<style> [data-testid="stSidebar"] { display: none; } </style>""", unsafe_allow_html=True)
 
-if not st.session_state.get('logged_in'):
-    st.switch_page("app.py")
-
+session = auth_service.require_session('motorista')
 user_data = st.session_state.get('user_data', {})
-if user_data.get('role') != 'motorista':
-    st.error("Acesso negado.")
-    st.stop()
 
 col_header_1, col_header_2 = st.columns([4, 1])
 with col_header_1:
@@ -30,12 +25,13 @@ with col_header_2:
         auth_service.logout()
 st.caption(f"Motorista: {user_data.get('email')}")
 
-gestor_uid = user_data.get('gestor_uid')
+gestor_uid = session.get('gestor_uid')
 if not gestor_uid:
     st.error("Este usuário motorista não está associado a nenhum gestor. Por favor, contate um administrador.")
     st.stop()
 
-gestor_data = firestore_service.get_user(gestor_uid)
+# Credenciais do gestor servidas por um cache curto, separado do cache de usuários.
+gestor_data = firestore_service.get_gestor_access(gestor_uid)
 gestor_email_acesso = gestor_data.get('email') if gestor_data else None
 gestor_etrac_api_key = gestor_data.get('etrac_api_key') if gestor_data else None
 
@@ -43,7 +39,7 @@ if not gestor_email_acesso or not gestor_etrac_api_key:
     st.error("Seu gestor não foi encontrado ou não possui credenciais da eTrac configuradas.")
     st.stop()
 
-vehicles = etrac_service.get_vehicles_from_etrac(gestor_email_acesso, gestor_etrac_api_key)
+vehicles = fleet_cache.get_vehicles(gestor_email_acesso, gestor_etrac_api_key)
 if not vehicles:
     st.warning("Nenhum veículo foi retornado pela API da eTrac.")
     st.stop()
@@ -109,18 +105,16 @@ if selected_vehicle_str:
             st.error(f"Erro: É obrigatório tirar uma foto para os seguintes itens: {', '.join(failed_items_without_photo)}")
         else:
             with st.spinner("Salvando checklist e enviando fotos..."):
-                geofence = firestore_service.get_geofence_settings()
+                fences = geofence_util.compile_fences(firestore_service.get_geofences_for_gestor(gestor_uid))
                 location_status = "Não verificado"
-                if geofence:
+                if fences:
                     vehicle_pos = etrac_service.get_single_vehicle_position(gestor_email_acesso, gestor_etrac_api_key, selected_vehicle_data['placa'])
                     if vehicle_pos and 'latitude' in vehicle_pos and 'longitude' in vehicle_pos:
                         try:
                             lat, lon = float(vehicle_pos['latitude']), float(vehicle_pos['longitude'])
-                            distance = geo_util.haversine_distance(geofence['latitude'], geofence['longitude'], lat, lon)
-                            if distance <= geofence['radius_meters']:
-                                location_status = "Dentro da Base"
-                            else:
-                                location_status = f"Fora da Base ({int(distance)}m)"
+                            fence_index, distance = geofence_util.classify_points([lat], [lon], fences)
+                            inside = fence_index[0] >= 0
+                            location_status = geofence_util.location_status(inside, fences[fence_index[0]]['name'] if inside else None, distance[0])
                         except (ValueError, TypeError):
                             location_status = "Coordenada Inválida"
                     else:
@@ -132,7 +126,7 @@ if selected_vehicle_str:
                     "tracker_id": selected_vehicle_data.get('idRastreador') or selected_vehicle_data.get('equipamento_serial'),
                     "driver_uid": st.session_state.user_uid,
                     "driver_email": user_data['email'],
-                    "gestor_uid": user_data['gestor_uid'],
+                    "gestor_uid": gestor_uid,
                     "timestamp": datetime.now(),
                     "items": items_data_to_save,
                     "notes": st.session_state.current_checklist['notes'],
@@ -141,12 +135,19 @@ if selected_vehicle_str:
                 }
                 checklist_id = firestore_service.save_checklist(checklist_data)
                 if checklist_id and st.session_state.current_checklist['photos']:
-                    photo_updates = {}
+                    field_by_path, files_by_path = {}, {}
                     for item_name, photo_file in st.session_state.current_checklist['photos'].items():
-                        file_path = f"checklists/{checklist_id}/{item_name.replace(' ', '_')}.jpg"
-                        photo_url = storage_service.upload_file(photo_file, file_path)
-                        if photo_url:
-                            photo_updates[f"items.{item_name}.photo_url"] = photo_url
+                        base_path = f"checklists/{checklist_id}/{item_name.replace(' ', '_')}"
+                        photo, thumbnail = image_util.prepare_photo(photo_file)
+                        field_by_path[f"{base_path}.jpg"] = (item_name, "photo_url")
+                        files_by_path[f"{base_path}.jpg"] = photo
+                        if thumbnail:
+                            field_by_path[f"{base_path}_thumb.jpg"] = (item_name, "thumb_url")
+                            files_by_path[f"{base_path}_thumb.jpg"] = thumbnail
+                    photo_urls, upload_errors = storage_service.upload_files(files_by_path)
+                    for file_path, error in upload_errors.items():
+                        st.error(f"Erro no upload da foto de {field_by_path[file_path][0]}: {error}")
+                    photo_updates = {f"items.{field_by_path[file_path][0]}.{field_by_path[file_path][1]}": photo_url for file_path, photo_url in photo_urls.items()}
                     if photo_updates:
                         firestore_service.update_checklist_with_photos(checklist_id, photo_updates)
                 if is_ok:
@@ -156,8 +157,8 @@ if selected_vehicle_str:
                     vehicle_details = firestore_service.get_vehicle_details_by_plate(plate)
                     if vehicle_details and vehicle_details.get('tracker_sim_number'):
                         sim_number = vehicle_details['tracker_sim_number']
-                        st.info(f"Todos os itens OK. Enviando comando de desbloqueio para o veículo {plate}...")
-                        twilio_service.send_unlock_sms(to_number=sim_number, equipamento_serial=serial, admin_email_logger=user_data['email'])
+                        outbox_service.enqueue_unlock_sms(sim_number, serial, user_data['email'], idempotency_key=f"checklist-{checklist_id}-sms" if checklist_id else None)
+                        st.info(f"Todos os itens OK. Comando de desbloqueio para o veículo {plate} enviado para processamento.")
                     else:
                         st.error(f"ERRO: Não foi possível desbloquear o veículo {plate}. Nenhum número de chip está vinculado. Avise o administrador.")
                         checklist_data['status'] = "Pendente"
@@ -173,8 +174,13 @@ if selected_vehicle_str:
                                  <p><b>Localização:</b> {location_status}</p>
                                  <p><b>Observações:</b> {notes}</p>
                                  <p>Por favor, acesse o painel de gestor para aprovar ou reprovar a saída do veículo.</p>"""
-                        notification_service.send_email_notification(gestor_data['email'], subject, body)
-                firestore_service.log_action(user_data['email'], "CHECKLIST_ENVIADO", f"Veículo {selected_vehicle_data['placa']} status {checklist_data['status']}.")
+                        email_key = f"checklist-{checklist_id}-email" if checklist_id else None
+                        digest_minutes = gestor_data.get('notification_digest_minutes') or 0
+                        if digest_minutes > 0:
+                            outbox_service.enqueue_digest_email(gestor_data['email'], subject, body, window_seconds=digest_minutes * 60, idempotency_key=email_key)
+                        else:
+                            outbox_service.enqueue_email(gestor_data['email'], subject, body, idempotency_key=email_key)
+                outbox_service.enqueue_log(user_data['email'], "CHECKLIST_ENVIADO", f"Veículo {selected_vehicle_data['placa']} status {checklist_data['status']}.", idempotency_key=f"checklist-{checklist_id}-log" if checklist_id else None)
                 st.success("Checklist enviado com sucesso!")
                 del st.session_state.current_checklist
                 st.rerun()
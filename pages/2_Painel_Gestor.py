@@ -1,36 +1,41 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import tempfile
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 from collections import Counter
 import numpy as np
 
 sys.path.append(os.getcwd())
 
-from services import firestore_service, auth_service, etrac_service, notification_service, twilio_service
+from services import firestore_service, auth_service, etrac_service, fleet_cache, trip_batch, outbox_service, maintenance_service, export_service, approval_queue
+from utils import bi_util, fleet_util, geofence_util
 
 st.set_page_config(page_title="Painel Gestor", layout="wide")
 
+HIST_PAGE_SIZE = 25
+# Intervalo (em segundos) da verificação de novos checklists pendentes.
+PENDING_REFRESH_SECONDS = 10
+
 st.markdown("""<style> [data-testid="stSidebar"] { display: none; } </style>""", unsafe_allow_html=True)
 
+session = auth_service.require_session('gestor', 'admin')
 is_impersonating = False
-if st.session_state.get('user_data', {}).get('role') == 'admin' and st.session_state.get('impersonated_uid'):
+if session.get('role') == 'admin':
+    if not st.session_state.get('impersonated_uid'):
+        st.error("Acesso negado.")
+        st.stop()
     is_impersonating = True
     display_user_data = st.session_state.get('impersonated_user_data', {})
     display_uid = st.session_state.get('impersonated_uid')
     real_user_data = st.session_state.get('user_data', {})
 else:
-    if not st.session_state.get('logged_in'):
-        st.switch_page("app.py")
     display_user_data = st.session_state.get('user_data', {})
-    display_uid = st.session_state.get('user_uid')
+    display_uid = session['uid']
     real_user_data = display_user_data
-    if display_user_data.get('role') != 'gestor':
-        st.error("Acesso negado.")
-        st.stop()
 
 col_header_1, col_header_2 = st.columns([4, 1])
 with col_header_1:
@@ -50,54 +55,11 @@ if is_impersonating:
     if st.button("⬅️ Voltar ao Painel de Admin"):
         exit_impersonation_mode()
 
-def check_for_maintenance_alerts(gestor_uid, gestor_email, api_key):
-    schedules = firestore_service.get_maintenance_schedules_for_gestor(gestor_uid)
-    if not schedules: return
-    vehicles = etrac_service.get_vehicles_from_etrac(gestor_email, api_key)
-    if not vehicles: return
-
-    overdue_vehicles = []
-    for vehicle in vehicles:
-        plate = vehicle.get('placa')
-        if not plate or plate not in schedules: continue
-        try:
-            current_odom_str = vehicle.get('odometro', '0').replace('km', '').replace('.', '').replace(',', '.').strip()
-            current_odom = float(current_odom_str)
-        except (ValueError, TypeError): continue
-        
-        schedule = schedules[plate]
-        last_km = float(schedule.get('last_maintenance_km', 0))
-        threshold = float(schedule.get('threshold_km', 0))
-        alert_range = float(schedule.get('alert_range_km', 0))
-        notified_km = float(schedule.get('notification_sent_for_km', last_km))
-        
-        next_maintenance_km = last_km + threshold
-        alert_starts_at_km = next_maintenance_km - alert_range
-
-        if threshold > 0 and current_odom >= alert_starts_at_km and notified_km < alert_starts_at_km:
-            overdue_vehicles.append({
-                "placa": plate, "odometro_atual": int(current_odom),
-                "limite_km": int(next_maintenance_km), "plano_desc": schedule.get('notes', 'Manutenção Preventiva')
-            })
-            os_data = {
-                "created_at": datetime.now(), "status": "Aberta", "vehicle_plate": plate,
-                "driver_email": "SISTEMA", "gestor_uid": gestor_uid,
-                "checklist_notes": f"Manutenção preventiva por odômetro. Limite de {int(next_maintenance_km)}km se aproximando. Odômetro atual: {int(current_odom)}km.",
-                "failed_items": [schedule.get('notes', 'Manutenção Preventiva')], "maintenance_notes": ""
-            }
-            firestore_service.create_maintenance_order(os_data)
-            firestore_service.update_maintenance_schedule(plate, {"notification_sent_for_km": next_maintenance_km})
-    
-    if overdue_vehicles:
-        for v in overdue_vehicles:
-            st.toast(f"🚨 Alerta: Manutenção para {v['placa']} está próxima!", icon="🚨")
-        subject = "Alerta de Manutenção Preventiva Próxima do Vencimento"
-        email_body = "<h3>Os seguintes veículos entraram na janela de alerta para manutenção programada:</h3><ul>"
-        for v in overdue_vehicles:
-            email_body += f"<li><b>Veículo:</b> {v['placa']}<br><b>Manutenção:</b> {v['plano_desc']}<br><b>Odômetro Atual:</b> {v['odometro_atual']} km<br><b>Limite:</b> {v['limite_km']} km</li>"
-        email_body += "</ul><p>Uma Ordem de Serviço foi criada automaticamente no painel de manutenção.</p>"
-        notification_service.send_email_notification(gestor_email, subject, email_body)
-        firestore_service.log_action(gestor_email, "ALERTA_MANUTENCAO", f"{len(overdue_vehicles)} veículos com manutenção próxima.")
+@st.cache_data(ttl=300)
+def load_bi_frames(gestor_uid, start_day):
+    # Sem os itens: as tendências usam apenas os campos de status e datas dos checklists.
+    checklists = firestore_service.get_checklists_for_gestor(gestor_uid, start_date=datetime.combine(start_day, datetime.min.time()), fields=bi_util.TREND_FIELDS)
+    return bi_util.build_frames(checklists)
 
 tab_mapa, tab_aprov, tab_hist, tab_bi, tab_maint, tab_motoristas, tab_checklist = st.tabs([
     "🗺️ Mapa da Frota", "⚠️ Aprovações", "📋 Histórico", "📈 Análise (BI)", 
@@ -107,42 +69,98 @@ tab_mapa, tab_aprov, tab_hist, tab_bi, tab_maint, tab_motoristas, tab_checklist
 with tab_mapa:
     st.subheader("Localização da Frota em Tempo Real")
     if st.button("Atualizar Posições"):
-        st.cache_data.clear()
-    @st.cache_data(ttl=120)
-    def get_vehicles_cached(email, api_key):
-        return etrac_service.get_vehicles_from_etrac(email, api_key)
-    vehicles_list = get_vehicles_cached(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
+        fleet_cache.invalidate(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
+    gestor_fences = firestore_service.get_geofences_for_gestor(display_uid, include_global=False)
+    with st.expander(f"📍 Cercas Eletrônicas (Pátios) - {len(gestor_fences)} cadastrada(s)"):
+        st.caption("Cadastre os pátios da sua operação como círculos (centro e raio) ou polígonos (um vértice 'latitude, longitude' por linha). Sem cercas próprias, vale a cerca global definida pelo administrador.")
+        for fence in gestor_fences:
+            col1, col2 = st.columns([4, 1])
+            if fence.get('type') == 'polygon':
+                col1.write(f"**{fence.get('name') or 'Sem nome'}** - Polígono com {len(fence.get('points', []))} vértices")
+            else:
+                col1.write(f"**{fence.get('name') or 'Sem nome'}** - Círculo de {int(fence.get('radius_meters', 0))}m em ({fence.get('latitude')}, {fence.get('longitude')})")
+            if col2.button("Excluir", key=f"delete_fence_{fence['doc_id']}"):
+                firestore_service.delete_geofence(fence['doc_id'], display_uid)
+                st.rerun()
+        with st.form("new_fence_form", clear_on_submit=True):
+            fence_name = st.text_input("Nome do Pátio")
+            fence_type = st.radio("Tipo de Cerca", ["Círculo", "Polígono"], horizontal=True)
+            col1, col2, col3 = st.columns(3)
+            fence_lat = col1.number_input("Latitude do Centro", value=0.0, format="%.6f")
+            fence_lon = col2.number_input("Longitude do Centro", value=0.0, format="%.6f")
+            fence_radius = col3.number_input("Raio (metros)", value=500, min_value=50, step=50)
+            fence_points = st.text_area("Vértices do Polígono (um 'latitude, longitude' por linha)")
+            if st.form_submit_button("Adicionar Cerca"):
+                fence_data = {"gestor_uid": display_uid, "name": fence_name.strip()}
+                if fence_type == "Círculo":
+                    fence_data.update({"type": "circle", "latitude": fence_lat, "longitude": fence_lon, "radius_meters": fence_radius})
+                else:
+                    try:
+                        points = [line.split(",") for line in fence_points.splitlines() if line.strip()]
+                        fence_data.update({"type": "polygon", "points": [{"latitude": float(p[0]), "longitude": float(p[1])} for p in points]})
+                    except (ValueError, IndexError):
+                        fence_data = None
+                if not fence_data or not geofence_util.compile_fences([fence_data]):
+                    st.error("Cerca inválida. Verifique as coordenadas (polígonos precisam de pelo menos 3 vértices).")
+                elif firestore_service.save_geofence(fence_data):
+                    st.success("Cerca cadastrada."); st.rerun()
+    vehicles_list = fleet_cache.get_vehicles(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
     if not vehicles_list:
         st.warning("Nenhum veículo encontrado para exibir no mapa.")
     else:
-        map_data, status_data = [], []
+        fleet = fleet_util.build_fleet_frame(vehicles_list)
+        fences_for_map = gestor_fences or firestore_service.get_geofences_for_gestor(display_uid)
+        locations = geofence_util.classify_fleet(fleet, fences_for_map)
+        location_by_plate = locations['location_status'].to_dict()
+        status_data = []
         for v in vehicles_list:
-            lat, lon = v.get('latitude'), v.get('longitude')
-            if lat and lon and str(lat).strip() and str(lon).strip():
-                try: map_data.append({'lat': float(lat), 'lon': float(lon)})
-                except (ValueError, TypeError): continue
-            
             ignicao_status = "✔️ Ligada" if v.get('ignicao') == 1 else "❌ Desligada"
             bateria_status = f"{v.get('bateria')}V"
             status_data.append({
                 "Veículo": f"{v.get('placa')} ({v.get('descricao')})",
                 "Ignição": ignicao_status, "Bateria": bateria_status, "Velocidade": v.get('velocidade'),
+                "Localização": location_by_plate.get(v.get('placa'), "Coordenada Inválida"),
                 "Última Transmissão": v.get('data_transmissao')
             })
-        if map_data:
-            df_map = pd.DataFrame(map_data)
-            st.map(df_map)
+        df_map = locations.dropna(subset=['latitude', 'longitude']).rename(columns={'latitude': 'lat', 'longitude': 'lon'})
+        if not df_map.empty:
+            if fences_for_map:
+                st.caption(f"🟢 {int(locations['inside'].sum())} veículo(s) dentro de um pátio · 🔴 {int((~locations['inside'] & locations['distance_m'].notna()).sum())} fora")
+                df_map['color'] = np.where(df_map['inside'], "#2e7d32", "#c62828")
+                st.map(df_map[['lat', 'lon', 'color']], color='color')
+            else:
+                st.map(df_map[['lat', 'lon']])
             st.dataframe(pd.DataFrame(status_data), use_container_width=True, hide_index=True)
         else:
             st.info("Nenhum veículo com coordenadas válidas para exibir no mapa.")
 
 with tab_aprov:
     st.subheader("Checklists Pendentes de Aprovação")
-    pending_checklists = firestore_service.get_pending_checklists_for_gestor(display_uid)
+    with st.expander("🔔 Preferências de Notificação"):
+        with st.form("notification_prefs_form"):
+            digest_minutes = st.number_input("Agrupar alertas de checklist em um único e-mail a cada X minutos (0 = enviar cada alerta imediatamente)", min_value=0, max_value=1440, step=5, value=int(display_user_data.get('notification_digest_minutes') or 0))
+            if st.form_submit_button("Salvar Preferências"):
+                firestore_service.update_user_data(display_uid, {'notification_digest_minutes': int(digest_minutes)})
+                display_user_data['notification_digest_minutes'] = int(digest_minutes)
+                st.success("Preferências de notificação salvas.")
+    pending_checklists, st.session_state.pending_version = approval_queue.get_pending_snapshot(display_uid)
+
+    @st.fragment(run_every=PENDING_REFRESH_SECONDS)
+    def watch_pending_queue():
+        # Apenas compara a versão da fila em memória; a página só é refeita quando há mudanças.
+        # Versão None = sem listener ativo (consulta direta). A página é refeita uma vez ao
+        # entrar nesse estado (listener caiu) e ao sair dele (novo listener pronto), nunca em laço.
+        rendered_version = st.session_state.get('pending_version')
+        current_version = approval_queue.get_version(display_uid)
+        if current_version != rendered_version:
+            st.rerun(scope="app")
+    watch_pending_queue()
+
     if not pending_checklists:
         st.success("Nenhum checklist pendente no momento.")
     else:
         st.info(f"Você tem {len(pending_checklists)} checklist(s) aguardando sua ação.")
+        pending_vehicle_details = firestore_service.get_vehicle_details_by_plates(c.get('vehicle_plate') for c in pending_checklists)
         for checklist in pending_checklists:
             checklist_time = checklist['timestamp'].strftime('%d/%m/%Y às %H:%M')
             with st.expander(f"**Veículo:** {checklist['vehicle_plate']} | **Motorista:** {checklist['driver_email']} | **Data:** {checklist_time}"):
@@ -151,7 +169,8 @@ with tab_aprov:
                     if isinstance(item_data, dict) and item_data.get('status') == "Não OK":
                         st.warning(f"- {item_name.replace('_', ' ').capitalize()}: **{item_data['status']}**")
                         if item_data.get('photo_url'):
-                            st.image(item_data['photo_url'], caption=f"Foto para {item_name}", width=300)
+                            st.image(item_data.get('thumb_url') or item_data['photo_url'], caption=f"Foto para {item_name}", width=300)
+                            st.markdown(f"[Ver foto original]({item_data['photo_url']})")
                 st.write("**Observações do Motorista:**")
                 st.text_area("Notas", value=checklist['notes'], height=100, disabled=True, key=f"notes_{checklist['doc_id']}")
                 col1, col2 = st.columns(2)
@@ -160,67 +179,148 @@ with tab_aprov:
                         plate = checklist.get('vehicle_plate')
                         tracker_id = checklist.get('tracker_id')
                         
-                        vehicle_details = firestore_service.get_vehicle_details_by_plate(plate)
+                        vehicle_details = pending_vehicle_details.get(plate)
                         if vehicle_details and vehicle_details.get('tracker_sim_number'):
                             sim_number = vehicle_details.get('tracker_sim_number')
-                            twilio_service.send_unlock_sms(
-                                to_number=sim_number,
-                                equipamento_serial=tracker_id,
-                                admin_email_logger=real_user_data['email']
-                            )
+                            outbox_service.enqueue_unlock_sms(sim_number, tracker_id, real_user_data['email'], idempotency_key=f"approval-{checklist['doc_id']}-sms")
+                            st.success(f"Comando de desbloqueio para o número {sim_number} enviado para processamento.")
                         else:
                             st.error(f"Veículo aprovado, mas o comando SMS não pôde ser enviado: Chip não cadastrado para a placa {plate}.")
                         
                         firestore_service.update_checklist_status(checklist['doc_id'], "Aprovado pelo Gestor", display_user_data['email'])
-                        firestore_service.log_action(real_user_data['email'], "APROVACAO_CHECKLIST", f"Checklist para {checklist['vehicle_plate']} aprovado.")
+                        outbox_service.enqueue_log(real_user_data['email'], "APROVACAO_CHECKLIST", f"Checklist para {checklist['vehicle_plate']} aprovado.", idempotency_key=f"approval-{checklist['doc_id']}-log")
+                        approval_queue.discard(display_uid, checklist['doc_id'])
+                        st.session_state.pop('hist_pages', None)
                         st.rerun()
                 with col2:
                     if st.button("❌ Reprovar e Criar OS", key=f"reject_{checklist['doc_id']}"):
                         firestore_service.update_checklist_status(checklist['doc_id'], "Reprovado pelo Gestor", display_user_data['email'])
                         firestore_service.create_maintenance_order(checklist)
-                        firestore_service.log_action(real_user_data['email'], "REPROVACAO_CHECKLIST", f"Checklist para {checklist['vehicle_plate']} reprovado.")
+                        outbox_service.enqueue_log(real_user_data['email'], "REPROVACAO_CHECKLIST", f"Checklist para {checklist['vehicle_plate']} reprovado.", idempotency_key=f"rejection-{checklist['doc_id']}-log")
                         st.error("Checklist reprovado e Ordem de Serviço criada.")
+                        approval_queue.discard(display_uid, checklist['doc_id'])
+                        st.session_state.pop('hist_pages', None)
                         st.rerun()
 
 with tab_hist:
     st.subheader("Relatório de Checklists")
-    all_checklists = firestore_service.get_checklists_for_gestor(display_uid)
-    if not all_checklists:
+    hist_range = st.date_input("Filtrar por período (opcional)", value=[], key="hist_range")
+    hist_start, hist_end = None, None
+    if isinstance(hist_range, (list, tuple)) and len(hist_range) == 2:
+        hist_start = datetime.combine(hist_range[0], datetime.min.time())
+        hist_end = datetime.combine(hist_range[1], datetime.max.time())
+    if st.session_state.get('hist_filter') != (hist_start, hist_end):
+        st.session_state.hist_filter = (hist_start, hist_end)
+        st.session_state.hist_cursors = [None]
+        st.session_state.hist_pages = {}
+    hist_cursors = st.session_state.hist_cursors
+    hist_pages = st.session_state.setdefault('hist_pages', {})
+    # Cada página é consultada uma única vez; selecionar uma linha não refaz a consulta.
+    page_number = len(hist_cursors)
+    if page_number not in hist_pages:
+        hist_pages[page_number] = firestore_service.get_checklists_page(
+            display_uid, page_size=HIST_PAGE_SIZE, start_after_doc=hist_cursors[-1],
+            start_date=hist_start, end_date=hist_end, fields=firestore_service.CHECKLIST_SUMMARY_FIELDS
+        )
+    page_checklists, next_cursor = hist_pages[page_number]
+    grid = None
+    if not page_checklists:
         st.info("Nenhum checklist encontrado no histórico.")
     else:
         st.markdown("#### Resumo dos Checklists")
+        st.caption("Selecione uma linha para ver os itens e as fotos do checklist.")
         summary_data = [{'Data': item['timestamp'].strftime('%d/%m/%Y %H:%M'), 'Veículo': item.get('vehicle_plate', 'N/A'),
                          'Motorista': item.get('driver_email', 'N/A'), 'Status': item.get('status', 'N/A'),
-                         'Localização': item.get('location_status', 'N/A')} for item in all_checklists]
+                         'Localização': item.get('location_status', 'N/A')} for item in page_checklists]
         df = pd.DataFrame(summary_data)
-        st.dataframe(df, use_container_width=True, hide_index=True)
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.download_button("📥 Baixar Resumo como CSV", csv, f'resumo_checklists_{datetime.now().strftime("%Y%m%d")}.csv', 'text/csv')
+        grid = st.dataframe(df, use_container_width=True, hide_index=True, on_select="rerun", selection_mode="single-row", key=f"hist_grid_{page_number}")
+    # Navegação e exportação ficam disponíveis mesmo quando a página está vazia.
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Anterior", disabled=len(hist_cursors) == 1, use_container_width=True):
+            hist_cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Página {page_number}")
+        if st.button("🔄 Atualizar", use_container_width=True):
+            st.session_state.hist_cursors = [None]
+            st.session_state.hist_pages = {}
+            st.rerun()
+    with col3:
+        if st.button("Próxima ➡️", disabled=next_cursor is None, use_container_width=True):
+            hist_cursors.append(next_cursor)
+            st.rerun()
+    with st.expander("📥 Exportar Histórico"):
+        with st.form("hist_export_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                export_statuses = st.multiselect("Status (vazio = todos)", options=export_service.CHECKLIST_STATUSES)
+                export_layout = st.radio("Layout", ["Uma linha por checklist", "Uma linha por item (análise)"])
+            with col2:
+                export_format = st.radio("Formato", ["CSV", "Parquet"], horizontal=True)
+                st.caption("O período exportado é o mesmo filtro de datas do relatório acima.")
+            if st.form_submit_button("Gerar Arquivo"):
+                export_service.discard_export(st.session_state.pop('hist_export', None))
+                file_format = export_format.lower()
+                layout = export_service.LAYOUT_ITEMS if "item" in export_layout else export_service.LAYOUT_SUMMARY
+                with st.spinner("Exportando histórico..."):
+                    fd, export_path = tempfile.mkstemp(suffix=f".{file_format}")
+                    try:
+                        with os.fdopen(fd, 'wb') as export_file:
+                            total_rows = export_service.export_checklists(
+                                export_file, display_uid, file_format=file_format, layout=layout,
+                                start_date=hist_start, end_date=hist_end, statuses=export_statuses or None
+                            )
+                        st.session_state.hist_export = {
+                            'path': export_path, 'rows': total_rows, 'mime': 'text/csv' if file_format == 'csv' else 'application/octet-stream',
+                            'file_name': f'checklists_{layout}_{datetime.now().strftime("%Y%m%d")}.{file_format}'
+                        }
+                    except Exception as e:
+                        os.remove(export_path)
+                        st.error(f"Falha ao exportar o histórico: {e}")
+        hist_export = st.session_state.get('hist_export')
+        if hist_export and os.path.exists(hist_export['path']):
+            st.caption(f"{hist_export['rows']} linha(s) exportada(s).")
+            with open(hist_export['path'], 'rb') as export_file:
+                st.download_button("📥 Baixar Arquivo", export_file, hist_export['file_name'], hist_export['mime'])
+    selected_rows = grid.selection.rows if grid else []
+    if selected_rows:
         st.divider()
-        st.subheader("Detalhes dos Checklists Individuais")
-        for checklist in all_checklists:
+        selected_id = page_checklists[selected_rows[0]]['doc_id']
+        # O documento completo (itens e URLs das fotos) só é lido para o checklist selecionado.
+        if st.session_state.get('hist_detail', (None, None))[0] != selected_id:
+            st.session_state.hist_detail = (selected_id, firestore_service.get_checklist(selected_id))
+        checklist = st.session_state.hist_detail[1]
+        if not checklist:
+            st.warning("Este checklist não foi encontrado. Ele pode ter sido removido.")
+        else:
             checklist_time = checklist['timestamp'].strftime('%d/%m/%Y às %H:%M')
-            with st.expander(f"**Veículo:** {checklist.get('vehicle_plate', 'N/A')} | **Motorista:** {checklist.get('driver_email', 'N/A')} | **Data:** {checklist_time} | **Status:** {checklist.get('status', 'N/A')}"):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("**Informações Gerais**")
-                    st.text(f"Status do Geofence: {checklist.get('location_status', 'N/A')}")
-                    st.text("Observações do Motorista:")
-                    st.text_area("Observações", value=checklist.get('notes', 'Nenhuma.'), height=150, disabled=True, key=f"notes_hist_{checklist['timestamp']}_{checklist.get('vehicle_plate')}")
-                with col2:
-                    st.markdown("**Itens Verificados**")
-                    items = checklist.get('items', {})
-                    for item_name, item_data in items.items():
-                        status = item_data.get('status', 'N/A')
-                        if status == "OK":
-                            st.success(f"✔️ {item_name}: {status}")
-                        else:
-                            st.error(f"❌ {item_name}: {status}")
-                        if item_data.get('photo_url'):
-                            st.image(item_data['photo_url'], caption=f"Foto para {item_name}", width=200)
+            st.subheader(f"Checklist de {checklist.get('vehicle_plate', 'N/A')} em {checklist_time}")
+            st.caption(f"**Motorista:** {checklist.get('driver_email', 'N/A')} | **Status:** {checklist.get('status', 'N/A')}")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Informações Gerais**")
+                st.text(f"Status do Geofence: {checklist.get('location_status', 'N/A')}")
+                st.text("Observações do Motorista:")
+                st.text_area("Observações", value=checklist.get('notes', 'Nenhuma.'), height=150, disabled=True, key=f"notes_hist_{selected_id}")
+            with col2:
+                st.markdown("**Itens Verificados**")
+                items = checklist.get('items', {})
+                for item_name, item_data in items.items():
+                    # Checklists antigos guardam o item como texto simples.
+                    if not isinstance(item_data, dict):
+                        item_data = {'status': item_data}
+                    status = item_data.get('status', 'N/A')
+                    if status == "OK":
+                        st.success(f"✔️ {item_name}: {status}")
+                    else:
+                        st.error(f"❌ {item_name}: {status}")
+                    if item_data.get('photo_url'):
+                        st.image(item_data.get('thumb_url') or item_data['photo_url'], caption=f"Foto para {item_name}", width=200)
+                        st.markdown(f"[Ver foto original]({item_data['photo_url']})")
     st.divider()
     st.subheader("Histórico Detalhado de Viagens por Veículo")
-    vehicles_from_api_hist = etrac_service.get_vehicles_from_etrac(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
+    vehicles_from_api_hist = fleet_cache.get_vehicles(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
     if vehicles_from_api_hist:
         plate_options = sorted(list(set(v['placa'] for v in vehicles_from_api_hist)))
         col1, col2, col3 = st.columns([2,1,1])
@@ -241,47 +341,120 @@ with tab_hist:
                 st.dataframe(trips, use_container_width=True, hide_index=True)
             else:
                 st.info("Nenhuma viagem encontrada para este veículo nesta data.")
+        st.divider()
+        st.subheader("Relatório de Viagens da Frota por Período")
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            report_plates = st.multiselect("Veículos (vazio = frota inteira)", options=plate_options, key="fleet_report_plates")
+        with col2:
+            report_range = st.date_input("Período", value=(datetime.now().date().replace(day=1), datetime.now().date()), key="fleet_report_range")
+        if st.button("Gerar Relatório da Frota") and isinstance(report_range, tuple) and len(report_range) == 2:
+            plates_to_fetch = report_plates or plate_options
+            days_to_fetch = trip_batch.date_range(report_range[0], report_range[1])
+            total_pairs = len(plates_to_fetch) * len(days_to_fetch)
+            progress = st.progress(0.0, text="Buscando viagens da frota...")
+            done = [0]
+            def update_progress(plate, day, trips, error):
+                done[0] += 1
+                progress.progress(done[0] / total_pairs, text=f"Buscando viagens da frota... {done[0]}/{total_pairs}")
+            results, errors = trip_batch.fetch_trip_summaries(display_user_data.get('email'), display_user_data.get('etrac_api_key'), plates_to_fetch, days_to_fetch, on_result=update_progress)
+            progress.empty()
+            report_rows = []
+            for (plate, day), trips in sorted(results.items()):
+                for trip in trips:
+                    row = {'Veículo': plate, 'Data': day.strftime('%d/%m/%Y')}
+                    row.update(trip if isinstance(trip, dict) else {'Viagem': trip})
+                    report_rows.append(row)
+            st.session_state.fleet_trip_report = report_rows
+            if errors:
+                st.warning(f"{len(errors)} consulta(s) falharam e podem ser repetidas gerando o relatório novamente.")
+        if st.session_state.get('fleet_trip_report') is not None:
+            report_rows = st.session_state.fleet_trip_report
+            if report_rows:
+                df_report = pd.DataFrame(report_rows)
+                st.dataframe(df_report, use_container_width=True, hide_index=True)
+                st.download_button("📥 Baixar Relatório da Frota como CSV", df_report.to_csv(index=False).encode('utf-8'), f'viagens_frota_{datetime.now().strftime("%Y%m%d")}.csv', 'text/csv')
+            else:
+                st.info("Nenhuma viagem encontrada para o período selecionado.")
 
 with tab_bi:
     st.subheader("Análise de Inconformidades (BI)")
-    all_checklists_bi = firestore_service.get_checklists_for_gestor(display_uid)
-    if not all_checklists_bi:
-        st.info("Não há dados de checklists para analisar.")
-    else:
-        failed_items, failed_vehicles = [], []
-        for checklist in all_checklists_bi:
-            if checklist.get('status') and 'Aprovado' not in checklist.get('status'):
-                failed_vehicles.append(checklist.get('vehicle_plate'))
-                for item, status in checklist.get('items', {}).items():
-                    if isinstance(status, dict) and status.get('status') == 'Não OK':
-                        failed_items.append(item.replace('_', ' ').capitalize())
-                    elif isinstance(status, str) and status == 'Não OK':
-                        failed_items.append(item.replace('_', ' ').capitalize())
+    bi_periods = {"Todo o período": None, "Últimos 7 dias": 7, "Últimos 30 dias": 30, "Últimos 90 dias": 90}
+    selected_bi_period = st.selectbox("Período", options=bi_periods.keys(), key="bi_period")
+    bi_days = bi_periods[selected_bi_period]
+    bi_start_day = (datetime.now() - timedelta(days=bi_days - 1)).date() if bi_days else None
+    bi_counts = firestore_service.get_bi_aggregates(display_uid, start_day=bi_start_day)
+    if not bi_counts['backfilled']:
+        st.info("Os indicadores do histórico anterior ainda não foram calculados; os números abaixo incluem apenas os checklists mais recentes. Peça ao administrador para reconstruí-los.")
+    item_counts = Counter()
+    for item, count in bi_counts['failed_items'].items():
+        item_counts[item.replace('_', ' ').capitalize()] += count
+    vehicle_counts = bi_counts['failed_vehicles']
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("##### Itens que mais falham")
+        if item_counts:
+            fig, ax = plt.subplots()
+            ax.pie(item_counts.values(), labels=item_counts.keys(), autopct='%1.1f%%', startangle=90)
+            ax.axis('equal'); st.pyplot(fig)
+        else:
+            st.success("Nenhuma falha registrada!")
+    with col2:
+        st.markdown("##### Veículos com mais inconformidades")
+        if vehicle_counts:
+            df_v = pd.DataFrame(vehicle_counts.items(), columns=['Veículo', 'Nº de Falhas']).sort_values('Nº de Falhas', ascending=False)
+            st.dataframe(df_v, use_container_width=True, hide_index=True)
+        else:
+            st.success("Nenhum veículo com falhas!")
+    st.divider()
+    st.markdown("#### Tendências e Tempo de Aprovação")
+    trend_start_day = bi_start_day or (datetime.now() - timedelta(days=89)).date()
+    if not bi_days:
+        st.caption("Tendências calculadas sobre os últimos 90 dias.")
+    # As tendências leem os checklists do período; por isso só são carregadas sob demanda.
+    show_trends = st.toggle("Carregar tendências do período", key="bi_show_trends")
+    checklists_df = load_bi_frames(display_uid, trend_start_day)[0] if show_trends else None
+    if checklists_df is not None and checklists_df.empty:
+        st.info("Não há dados de checklists para analisar neste período.")
+    elif checklists_df is not None:
         col1, col2 = st.columns(2)
         with col1:
-            st.markdown("##### Itens que mais falham")
-            if failed_items:
-                item_counts = Counter(failed_items)
-                fig, ax = plt.subplots()
-                ax.pie(item_counts.values(), labels=item_counts.keys(), autopct='%1.1f%%', startangle=90)
-                ax.axis('equal'); st.pyplot(fig)
+            st.markdown("##### Taxa de inconformidade (média móvel de 7 dias)")
+            st.line_chart(bi_util.rolling_failure_rate(checklists_df, "7D") * 100)
+        with col2:
+            st.markdown("##### Inconformidades por semana e veículo")
+            weekly_trend = bi_util.failure_trend(checklists_df, by="vehicle_plate", freq="W")
+            if weekly_trend.empty:
+                st.success("Nenhuma inconformidade no período!")
             else:
-                st.success("Nenhuma falha registrada!")
+                st.bar_chart(weekly_trend)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("##### Inconformidades por motorista")
+            df_drivers = bi_util.failure_rates(checklists_df, "driver_email").reset_index()
+            df_drivers.columns = ['Motorista', 'Checklists', 'Inconformes', 'Taxa']
+            df_drivers['Taxa'] = (df_drivers['Taxa'] * 100).round(1).astype(str) + '%'
+            st.dataframe(df_drivers, use_container_width=True, hide_index=True)
         with col2:
-            st.markdown("##### Veículos com mais inconformidades")
-            if failed_vehicles:
-                vehicle_counts = Counter(failed_vehicles)
-                df_v = pd.DataFrame(vehicle_counts.items(), columns=['Veículo', 'Nº de Falhas']).sort_values('Nº de Falhas', ascending=False)
-                st.dataframe(df_v, use_container_width=True, hide_index=True)
+            st.markdown("##### Tempo até a decisão do gestor (horas)")
+            df_approval = bi_util.time_to_approval(checklists_df, by="vehicle_plate").round(1).reset_index()
+            if df_approval.empty:
+                st.info("Nenhum checklist decidido pelo gestor no período.")
             else:
-                st.success("Nenhum veículo com falhas!")
+                df_approval.columns = ['Veículo', 'Decisões', 'Média', 'Mediana', 'Máximo']
+                st.dataframe(df_approval, use_container_width=True, hide_index=True)
 
 with tab_maint:
     st.subheader("Manutenção")
-    if 'maint_check_done' not in st.session_state:
-        with st.spinner("Verificando alertas de manutenção..."):
-            check_for_maintenance_alerts(gestor_uid=display_uid, gestor_email=display_user_data.get('email'), api_key=display_user_data.get('etrac_api_key'))
-        st.session_state.maint_check_done = True
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.caption(f"Os alertas de manutenção preventiva são verificados automaticamente a cada {maintenance_service.CHECK_INTERVAL_SECONDS // 60} minutos.")
+    with col2:
+        if st.button("Verificar Agora", use_container_width=True):
+            with st.spinner("Verificando alertas de manutenção..."):
+                new_orders = maintenance_service.process_gestor({**display_user_data, 'uid': display_uid}, firestore_service.get_maintenance_schedules_for_gestor(display_uid))
+            for v in new_orders:
+                st.toast(f"🚨 Alerta: Manutenção para {v['placa']} está próxima!", icon="🚨")
     st.subheader("Ordens de Serviço Corretivas e Preventivas")
     orders = firestore_service.get_maintenance_orders_for_gestor(display_uid)
     if not orders:
@@ -305,7 +478,7 @@ with tab_maint:
             plate_to_edit = st.session_state.editing_schedule_plate
             schedules = firestore_service.get_maintenance_schedules_for_gestor(display_uid)
             schedule_to_edit = schedules.get(plate_to_edit, {})
-            vehicles_maint_list = etrac_service.get_vehicles_from_etrac(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
+            vehicles_maint_list = fleet_cache.get_vehicles(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
             vehicle_info = next((v for v in vehicles_maint_list if v['placa'] == plate_to_edit), None)
             current_odometer = "N/A"
             if vehicle_info:
@@ -333,9 +506,10 @@ with tab_maint:
             if st.button("Carregar Veículos para Gerenciar Planos"):
                 st.session_state.load_vehicles_for_maint = True
             if st.session_state.get('load_vehicles_for_maint'):
-                vehicles_maint = etrac_service.get_vehicles_from_etrac(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
+                vehicles_maint = fleet_cache.get_vehicles(display_user_data.get('email'), display_user_data.get('etrac_api_key'))
                 schedules_maint = firestore_service.get_maintenance_schedules_for_gestor(display_uid)
                 if vehicles_maint:
+                    evaluation = fleet_util.evaluate_schedules(fleet_util.build_fleet_frame(vehicles_maint), fleet_util.build_schedule_frame(schedules_maint)) if schedules_maint else None
                     for v in vehicles_maint:
                         plate = v['placa']
                         schedule = schedules_maint.get(plate)
@@ -343,6 +517,12 @@ with tab_maint:
                         with col1:
                             if schedule:
                                 st.success(f"**{plate}:** Plano ativo - Manutenção a cada {int(schedule['threshold_km'])} km.")
+                                if evaluation is not None and plate in evaluation.index:
+                                    ev = evaluation.loc[plate]
+                                    forecast = f"Faltam {max(int(ev['km_remaining']), 0)} km para a próxima manutenção."
+                                    if pd.notna(ev['projected_due_date']):
+                                        forecast += f" Previsão: {ev['projected_due_date']:%d/%m/%Y} (média de {ev['km_per_day']:.0f} km/dia)."
+                                    st.caption(forecast)
                             else:
                                 st.warning(f"**{plate}:** Nenhum plano de manutenção configurado.")
                         with col2:
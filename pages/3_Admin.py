@@ -3,21 +3,18 @@ import sys
 import os
 import streamlit as st
 import pandas as pd
+from datetime import datetime, timedelta
 
 sys.path.append(os.getcwd())
 
-from services import firestore_service, auth_service, etrac_service
+from services import firestore_service, auth_service, fleet_cache, twilio_service
 
 st.set_page_config(page_title="Painel Admin", layout="wide")
 
 st.markdown("""<style> [data-testid="stSidebar"] { display: none; } </style>""", unsafe_allow_html=True)
 
-if not st.session_state.get('logged_in'):
-    st.switch_page("app.py")
-
+auth_service.require_session('admin')
 user_data = st.session_state.get('user_data', {})
-if user_data.get('role') != 'admin':
-    st.error("Acesso negado."); st.stop()
 
 col1, col2 = st.columns([4, 1])
 with col1:
@@ -32,6 +29,7 @@ def clear_editing_state():
     if 'editing_user_uid' in st.session_state:
         del st.session_state['editing_user_uid']
     st.cache_data.clear()
+    firestore_service.clear_user_cache()
 
 tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
     "⚙️ Gestão de Usuários", "👁️ Visualizar", "📲 Vincular Chip", 
@@ -104,6 +102,7 @@ with tab1:
             clear_editing_state(); st.rerun()
         all_users = firestore_service.get_all_users()
         if all_users:
+            gestores_by_uid = firestore_service.get_users_by_uids(user_row.get('gestor_uid') for user_row in all_users)
             col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
             col1.markdown("**Email**"); col2.markdown("**Papel**"); col3.markdown("**Gestor Associado**"); col4.markdown("**Ação**")
             for user_row in all_users:
@@ -114,13 +113,16 @@ with tab1:
                         gestor_email_display = ""
                         gestor_uid = user_row.get('gestor_uid')
                         if gestor_uid and isinstance(gestor_uid, str):
-                            gestor = firestore_service.get_user(gestor_uid)
+                            gestor = gestores_by_uid.get(gestor_uid)
                             gestor_email_display = gestor['email'] if gestor else "UID não encontrado"
                         st.write(gestor_email_display)
                     with c4:
                         if st.button("✏️ Editar", key=f"edit_{user_row['uid']}"):
                             st.session_state['editing_user_uid'] = user_row['uid']
                             st.rerun()
+                        if st.button("🔒 Sessões", key=f"revoke_{user_row['uid']}", help="Encerra todas as sessões abertas deste usuário."):
+                            auth_service.revoke_user_sessions(user_row['uid'])
+                            st.toast(f"Sessões de {user_row['email']} encerradas.")
                     st.divider()
         else:
             st.write("Nenhum motorista ou gestor cadastrado.")
@@ -139,6 +141,15 @@ with tab2:
             st.session_state['impersonated_uid'] = selected_manager['uid']
             st.session_state['impersonated_user_data'] = selected_manager
             st.switch_page("pages/2_Painel_Gestor.py")
+        st.divider()
+        st.subheader("Indicadores de BI")
+        st.info("Recalcula os contadores de inconformidades usados na aba de BI a partir do histórico completo de checklists.")
+        if st.button("Reconstruir Indicadores de Todos os Gestores"):
+            with st.spinner("Reconstruindo indicadores..."):
+                for manager in managers:
+                    firestore_service.rebuild_bi_aggregates(manager['uid'])
+            firestore_service.log_action(user_data['email'], "REBUILD_BI", f"Indicadores de BI reconstruídos para {len(managers)} gestores.")
+            st.success("Indicadores de BI reconstruídos com sucesso!")
 
 with tab3:
     st.subheader("Vincular Número do Chip ao Veículo")
@@ -155,15 +166,16 @@ with tab3:
         if not api_key:
             st.error("Este gestor não possui uma chave de API eTrac configurada.")
         else:
-            vehicles = etrac_service.get_vehicles_from_etrac(selected_manager_email, api_key)
+            vehicles = fleet_cache.get_vehicles(selected_manager_email, api_key)
             if not vehicles:
                 st.warning("Nenhum veículo encontrado para este gestor na API eTrac.")
             else:
                 st.write(f"Exibindo {len(vehicles)} veículos para **{selected_manager_email}**.")
+                saved_vehicles = firestore_service.get_vehicle_details_by_plates(v['placa'] for v in vehicles)
                 for i, vehicle in enumerate(vehicles):
                     plate = vehicle['placa']
                     serial = vehicle.get('idRastreador') or vehicle.get('equipamento_serial', 'N/A')
-                    saved_data = firestore_service.get_vehicle_details_by_plate(plate)
+                    saved_data = saved_vehicles.get(plate)
                     current_sim = saved_data.get('tracker_sim_number', "") if saved_data else ""
                     col1, col2, col3 = st.columns([2, 2, 3])
                     col1.text(f"Placa: {plate}"); col2.text(f"Serial: {serial}")
@@ -178,6 +190,25 @@ with tab3:
                             else:
                                 st.warning("Preencha o número do chip.")
                     st.divider()
+                st.subheader("Desbloqueio em Massa")
+                unlockable = {}
+                for vehicle in vehicles:
+                    saved_data = saved_vehicles.get(vehicle['placa'])
+                    serial = vehicle.get('idRastreador') or vehicle.get('equipamento_serial')
+                    if saved_data and saved_data.get('tracker_sim_number') and serial:
+                        unlockable[vehicle['placa']] = (saved_data['tracker_sim_number'], serial)
+                if not unlockable:
+                    st.info("Nenhum veículo desta frota possui chip vinculado.")
+                else:
+                    plates_to_unlock = st.multiselect("Veículos para enviar o comando de desbloqueio", options=sorted(unlockable.keys()), key="bulk_unlock_plates")
+                    if st.button("Enviar Comandos de Desbloqueio", type="primary", disabled=not plates_to_unlock):
+                        with st.spinner(f"Enviando {len(plates_to_unlock)} comando(s)..."):
+                            summary = twilio_service.send_unlock_commands([unlockable[plate] for plate in plates_to_unlock], admin_email_logger=user_data['email'])
+                        if summary['failed']:
+                            st.warning(f"{summary['sent']} de {summary['total']} comandos enviados em {summary['elapsed_seconds']}s; {summary['failed']} falharam.")
+                        else:
+                            st.success(f"{summary['sent']} comandos enviados em {summary['elapsed_seconds']}s.")
+                        st.dataframe(pd.DataFrame(summary['results']), use_container_width=True, hide_index=True)
 
 with tab4:
     st.subheader("Gerenciar Modelo de Checklist Padrão (Global)")
@@ -192,7 +223,7 @@ with tab4:
 
 with tab5:
     st.subheader("Configurar Geofence (Cerca Eletrônica)")
-    st.info("Defina o ponto central e o raio do pátio da empresa. Checklists feitos fora desta área serão sinalizados.")
+    st.info("Defina o ponto central e o raio do pátio da empresa. Checklists feitos fora desta área serão sinalizados. Gestores que cadastrarem seus próprios pátios (no mapa do Painel Gestor) usam as cercas deles no lugar desta.")
     current_settings = firestore_service.get_geofence_settings()
     lat_val = float(current_settings.get('latitude', 0.0)) if current_settings else 0.0
     lon_val = float(current_settings.get('longitude', 0.0)) if current_settings else 0.0
@@ -216,7 +247,7 @@ with tab6:
         gestor_uid = selected_manager_data['uid']
         api_key = selected_manager_data.get('etrac_api_key')
         if api_key:
-            vehicles = etrac_service.get_vehicles_from_etrac(selected_manager_email, api_key)
+            vehicles = fleet_cache.get_vehicles(selected_manager_email, api_key)
             schedules = firestore_service.get_maintenance_schedules_for_gestor(gestor_uid)
             if vehicles:
                 for i, v in enumerate(vehicles):
@@ -241,15 +272,68 @@ with tab6:
 
 with tab7:
     st.subheader("Logs de Auditoria")
-    if 'last_log_doc' not in st.session_state:
-        st.session_state.last_log_doc = None
-    logs_docs = firestore_service.get_logs_paginated(limit=10, start_after_doc=st.session_state.last_log_doc)
-    if logs_docs:
-        logs_data = [doc.to_dict() for doc in logs_docs]
-        df = pd.DataFrame(logs_data)
+    LOGS_PAGE_SIZE = 20
+    today = datetime.now().date()
+    logs_range = st.date_input("Período", value=(today - timedelta(days=6), today), key="logs_range")
+    if not (isinstance(logs_range, (list, tuple)) and len(logs_range) == 2):
+        st.info("Selecione a data inicial e a final do período.")
+        st.stop()
+    logs_start = datetime.combine(logs_range[0], datetime.min.time())
+    logs_end = datetime.combine(logs_range[1], datetime.max.time())
+    # Os totais vêm dos contadores diários, sem ler os documentos de log.
+    log_stats = firestore_service.get_log_stats(logs_range[0], logs_range[1])
+    col1, col2 = st.columns(2)
+    with col1:
+        logs_user = st.selectbox("Usuário", ["Todos"] + sorted(log_stats["users"]), key="logs_user")
+    with col2:
+        logs_action = st.selectbox("Ação", ["Todas"] + sorted(log_stats["actions"]), key="logs_action")
+    logs_user = None if logs_user == "Todos" else logs_user
+    logs_action = None if logs_action == "Todas" else logs_action
+
+    with st.expander("📊 Resumo do Período", expanded=False):
+        st.metric("Total de logs no período", log_stats["total"])
+        if st.button("Recalcular Contadores de Logs", help="Percorre todos os logs uma única vez para recriar os totais diários (necessário para logs anteriores aos contadores)."):
+            with st.spinner("Recalculando contadores..."):
+                rebuilt_days = firestore_service.rebuild_log_stats()
+            st.success(f"Contadores recalculados para {rebuilt_days} dia(s)."); st.rerun()
+        if log_stats["days"]:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Logs por dia**")
+                st.bar_chart(pd.Series(log_stats["days"]).sort_index())
+            with col2:
+                st.markdown("**Logs por ação**")
+                st.bar_chart(pd.Series(log_stats["actions"]).sort_values(ascending=False))
+
+    logs_filters = (logs_start, logs_end, logs_user, logs_action)
+    nav = st.session_state.get('logs_nav')
+    if not nav or nav['filters'] != logs_filters:
+        nav = st.session_state.logs_nav = {'filters': logs_filters, 'after': None, 'before': None, 'page': 1}
+    logs, first_doc, last_doc, has_more = firestore_service.get_logs_page(
+        limit=LOGS_PAGE_SIZE, after_doc=nav['after'], before_doc=nav['before'],
+        user=logs_user, action=logs_action, start_date=logs_start, end_date=logs_end
+    )
+    has_newer = has_more if nav['before'] else nav['after'] is not None
+    has_older = has_more if not nav['before'] else True
+    if logs_user or logs_action:
+        filtered_total = firestore_service.count_logs(logs_user, logs_action, logs_start, logs_end)
+        if filtered_total is not None:
+            st.caption(f"{filtered_total} log(s) encontrados com os filtros selecionados.")
+    if logs is None:
+        st.error("Não foi possível consultar os logs. Verifique se os índices de firestore.indexes.json foram criados no Firestore.")
+    elif logs:
+        df = pd.DataFrame(logs)
         st.dataframe(df[['timestamp', 'user', 'action', 'details']], use_container_width=True, hide_index=True)
-        if len(logs_docs) == 10 and st.button("Carregar mais"):
-            st.session_state.last_log_doc = logs_docs[-1]
-            st.rerun()
     else:
-        st.write("Nenhum log encontrado ou fim da lista.")
+        st.write("Nenhum log encontrado para os filtros selecionados.")
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Mais recentes", disabled=not (has_newer and first_doc), use_container_width=True):
+            st.session_state.logs_nav = {**nav, 'after': None, 'before': first_doc, 'page': nav['page'] - 1}
+            st.rerun()
+    with col2:
+        st.caption(f"Página {nav['page']}")
+    with col3:
+        if st.button("Mais antigos ➡️", disabled=not (has_older and last_doc), use_container_width=True):
+            st.session_state.logs_nav = {**nav, 'after': last_doc, 'before': None, 'page': nav['page'] + 1}
+            st.rerun()
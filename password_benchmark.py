@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Mede a vazão de verificação de senhas (logins por segundo) do pool de bcrypt.
+
+Uso:
+    python password_benchmark.py                       # custo atual (BCRYPT_ROUNDS)
+    python password_benchmark.py --rounds 10 12 14     # compara fatores de custo
+    python password_benchmark.py --workers 2 --duration 20
+"""
+import sys
+import os
+import argparse
+
+sys.path.append(os.getcwd())
+
+from services import password_hasher
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de logins por segundo por núcleo com bcrypt.")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[password_hasher.BCRYPT_ROUNDS], help="Fatores de custo do bcrypt a medir.")
+    parser.add_argument("--workers", type=int, default=password_hasher.HASH_POOL_WORKERS, help="Processos do pool.")
+    parser.add_argument("--duration", type=float, default=10, help="Duração de cada medição, em segundos.")
+    args = parser.parse_args()
+
+    print(f"{'custo':>5} {'processos':>9} {'logins/s':>9} {'logins/s/núcleo':>16}")
+    for rounds in args.rounds:
+        result = password_hasher.benchmark(rounds=rounds, duration_seconds=args.duration, workers=args.workers)
+        print(f"{result['rounds']:>5} {result['workers']:>9} {result['logins_per_second']:>9} {result['logins_per_second_per_core']:>16}")
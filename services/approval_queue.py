@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from .firebase_config import db
+
+# Tempo máximo (em segundos) de espera pelo primeiro snapshot de um gestor antes
+# de recorrer a uma consulta direta.
+INITIAL_SNAPSHOT_TIMEOUT_SECONDS = 5
+# Assinaturas sem leitura por este tempo são encerradas pela thread de manutenção.
+IDLE_TIMEOUT_SECONDS = 10 * 60
+JANITOR_INTERVAL_SECONDS = 60
+# Após uma falha do listener, o gestor é atendido por consultas diretas durante este
+# tempo; depois disso uma nova assinatura é feita.
+RESUBSCRIBE_BACKOFF_SECONDS = 60
+
+_views = {}  # gestor_uid -> _PendingView
+_failed = {}  # gestor_uid -> instante (monotonic) da última falha do listener
+_lock = threading.Lock()
+_janitor = None
+
+class _PendingView:
+    """Checklists pendentes de um gestor, mantidos em memória pelo listener do Firestore."""
+
+    def __init__(self):
+        self.checklists = {}  # doc_id -> dados
+        self.version = 0
+        self.ready = threading.Event()
+        self.last_read = time.monotonic()
+        self.watch = None
+        self.broken = False  # alterações que não puderam ser aplicadas: a visão deixou de ser confiável
+
+    def apply(self, changes):
+        with _lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self.checklists.pop(doc.id, None)
+                else:
+                    self.checklists[doc.id] = {**doc.to_dict(), 'doc_id': doc.id}
+            self.version += 1
+        self.ready.set()
+
+def _subscribe(gestor_uid, view):
+    def on_snapshot(doc_snapshots, changes, read_time):
+        try:
+            view.apply(changes)
+        except Exception as e:
+            print(f"Erro ao aplicar alterações de checklists pendentes do gestor {gestor_uid}: {e}")
+            view.broken = True
+
+    query = db.collection("checklists").where("gestor_uid", "==", gestor_uid).where("status", "==", "Pendente")
+    view.watch = query.on_snapshot(on_snapshot)
+
+def _is_healthy(view):
+    """
+    Falso se a visão deixou de refletir o Firestore: alterações não aplicadas, ou o
+    stream do listener foi encerrado (erro ou fechamento depois do primeiro snapshot).
+    """
+    if view.broken:
+        return False
+    watch = view.watch
+    if watch is None or not view.ready.is_set():
+        return True
+    if getattr(watch, "_closed", False):
+        return False
+    is_active = getattr(watch, "is_active", True)
+    return bool(is_active() if callable(is_active) else is_active)
+
+def _janitor_loop():
+    while True:
+        time.sleep(JANITOR_INTERVAL_SECONDS)
+        now = time.monotonic()
+        with _lock:
+            idle = [uid for uid, view in _views.items() if now - view.last_read > IDLE_TIMEOUT_SECONDS]
+            idle_views = [_views.pop(uid) for uid in idle]
+            for uid in [uid for uid, failed_at in _failed.items() if now - failed_at > RESUBSCRIBE_BACKOFF_SECONDS]:
+                del _failed[uid]
+            unhealthy = [(uid, view) for uid, view in _views.items() if not _is_healthy(view)]
+        for uid, view in unhealthy:
+            print(f"Listener de checklists pendentes do gestor {uid} encerrado; usando consulta direta.")
+            _mark_failed(uid, view)
+        for view in idle_views:
+            _unsubscribe(view)
+
+def _unsubscribe(view):
+    try:
+        if view.watch:
+            view.watch.unsubscribe()
+    except Exception as e:
+        print(f"Erro ao encerrar listener de checklists pendentes: {e}")
+
+def _mark_failed(gestor_uid, view):
+    """Descarta a assinatura que falhou; uma nova é feita após RESUBSCRIBE_BACKOFF_SECONDS."""
+    with _lock:
+        if _views.get(gestor_uid) is view:
+            del _views[gestor_uid]
+        _failed[gestor_uid] = time.monotonic()
+    _unsubscribe(view)
+
+def _get_view(gestor_uid):
+    global _janitor
+    with _lock:
+        view = _views.get(gestor_uid)
+        is_new = view is None
+        if is_new:
+            failed_at = _failed.get(gestor_uid)
+            if failed_at is not None and time.monotonic() - failed_at < RESUBSCRIBE_BACKOFF_SECONDS:
+                return None
+            _failed.pop(gestor_uid, None)
+            view = _views[gestor_uid] = _PendingView()
+        view.last_read = time.monotonic()
+        if _janitor is None:
+            _janitor = threading.Thread(target=_janitor_loop, name="approval-queue-janitor", daemon=True)
+            _janitor.start()
+    if is_new:
+        try:
+            _subscribe(gestor_uid, view)
+        except Exception as e:
+            print(f"Erro ao assinar checklists pendentes do gestor {gestor_uid}: {e}")
+            _mark_failed(gestor_uid, view)
+            return None
+    elif not _is_healthy(view):
+        # O stream caiu depois do primeiro snapshot: não serve dados parados como se estivessem ao vivo.
+        print(f"Listener de checklists pendentes do gestor {gestor_uid} encerrado; usando consulta direta.")
+        _mark_failed(gestor_uid, view)
+        return None
+    return view
+
+def get_pending_snapshot(gestor_uid):
+    """
+    Retorna (checklists pendentes do gestor, do mais recente para o mais antigo,
+    versão da fila). Depois do primeiro snapshot a leitura é feita da memória; o
+    listener aplica as alterações incrementalmente. Se o listener não responder a
+    tempo, a assinatura é marcada como falha e o Firestore é consultado diretamente
+    (versão None) até a próxima tentativa de assinatura.
+    """
+    view = _get_view(gestor_uid)
+    if view is not None and not view.ready.wait(INITIAL_SNAPSHOT_TIMEOUT_SECONDS):
+        print(f"Listener de checklists pendentes do gestor {gestor_uid} sem resposta; usando consulta direta.")
+        _mark_failed(gestor_uid, view)
+        view = None
+    if view is None:
+        from . import firestore_service
+        return firestore_service.get_pending_checklists_for_gestor(gestor_uid), None
+    with _lock:
+        checklists, version = list(view.checklists.values()), view.version
+    return sorted(checklists, key=lambda c: (c.get('timestamp') is not None, c.get('timestamp')), reverse=True), version
+
+def get_version(gestor_uid):
+    """
+    Número que muda a cada alteração na fila do gestor (leitura apenas em memória),
+    ou None enquanto o listener não tiver entregado o primeiro snapshot.
+    """
+    view = _get_view(gestor_uid)
+    if view is None or not view.ready.is_set():
+        return None
+    with _lock:
+        return view.version
+
+def discard(gestor_uid, doc_id):
+    """Remove um checklist da visão local logo após aprová-lo/reprová-lo, antes do listener confirmar."""
+    with _lock:
+        view = _views.get(gestor_uid)
+        if view and view.checklists.pop(doc_id, None) is not None:
+            view.version += 1
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+from .firebase_config import db
+
+# Logs de auditoria acumulados em memória e gravados em lote no Firestore.
+BATCH_SIZE = 500  # Limite de escritas por WriteBatch do Firestore.
+FLUSH_INTERVAL_SECONDS = 2
+# Novas tentativas de um lote após descartar logs já gravados (AlreadyExists).
+COMMIT_CONFLICT_RETRIES = 3
+# Acima deste volume pendente (ex: Firestore fora do ar), novos logs vão direto para o arquivo local.
+MAX_BUFFERED_ENTRIES = 10000
+FALLBACK_PATH = os.environ.get("AUDIT_LOG_FALLBACK_PATH", os.path.join(os.getcwd(), "data", "audit_log_fallback.jsonl"))
+
+_buffer = []  # [(log_id, dados do log)]
+_buffer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+def _start_flusher():
+    global _flusher
+    with _buffer_lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, name="audit-log-flusher", daemon=True)
+        _flusher.start()
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL_SECONDS)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"Erro ao gravar logs de auditoria: {e}")
+
+def log(user_email, action, details, timestamp=None, log_id=None):
+    """
+    Registra um log de auditoria sem esperar pelo Firestore. O log é gravado pelo
+    próximo flush, disparado a cada FLUSH_INTERVAL_SECONDS ou quando o buffer
+    atinge BATCH_SIZE entradas.
+    """
+    # O ID é definido já no registro para que reenvios (arquivo local) não dupliquem o log.
+    entry = (log_id or uuid4().hex, {"timestamp": timestamp or datetime.now(), "user": user_email, "action": action, "details": details})
+    with _buffer_lock:
+        overflow = len(_buffer) >= MAX_BUFFERED_ENTRIES
+        if not overflow:
+            _buffer.append(entry)
+            full = len(_buffer) >= BATCH_SIZE
+    if overflow:
+        _write_fallback([entry])
+        return
+    _start_flusher()
+    if full:
+        _wakeup.set()
+
+def _day_key(timestamp):
+    return timestamp.strftime('%Y-%m-%d')
+
+def add_to_batch(batch, entries):
+    """
+    Adiciona os logs [(log_id, dados)] ao WriteBatch junto com os contadores diários
+    em log_stats/{AAAA-MM-DD} (total, por ação e por usuário), que permitem exibir
+    totais sem percorrer a coleção de logs. Os logs usam create(): se algum já
+    existir, o lote inteiro falha com AlreadyExists e os contadores não são somados.
+    """
+    logs = db.collection("logs")
+    stats = {}
+    for log_id, log_data in entries:
+        day = _day_key(log_data["timestamp"])
+        batch.create(logs.document(log_id), {**log_data, "day": day})
+        day_stats = stats.setdefault(day, {"total": 0, "actions": {}, "users": {}})
+        day_stats["total"] += 1
+        day_stats["actions"][log_data["action"]] = day_stats["actions"].get(log_data["action"], 0) + 1
+        day_stats["users"][log_data["user"]] = day_stats["users"].get(log_data["user"], 0) + 1
+    for day, day_stats in stats.items():
+        batch.set(db.collection("log_stats").document(day), {
+            "day": day, "total": firestore.Increment(day_stats["total"]),
+            "actions": {key: firestore.Increment(value) for key, value in day_stats["actions"].items()},
+            "users": {key: firestore.Increment(value) for key, value in day_stats["users"].items()},
+        }, merge=True)
+
+def _commit_chunk(chunk):
+    """
+    Grava um lote de logs. Logs que já existem (reenvio de um lote confirmado, ou
+    gravação repetida pela outbox) são descartados antes de nova tentativa, para
+    que os contadores diários nunca sejam somados duas vezes.
+    """
+    for attempt in range(COMMIT_CONFLICT_RETRIES + 1):
+        if not chunk:
+            return
+        batch = db.batch()
+        add_to_batch(batch, chunk)
+        try:
+            batch.commit()
+            return
+        except AlreadyExists:
+            existing = {snapshot.id for snapshot in db.get_all([db.collection("logs").document(log_id) for log_id, _ in chunk]) if snapshot.exists}
+            if not existing or attempt == COMMIT_CONFLICT_RETRIES:
+                # O conflito não vem de logs já gravados: propaga para que o lote vá ao arquivo local.
+                raise
+            chunk = [entry for entry in chunk if entry[0] not in existing]
+
+def _commit(entries):
+    """Grava as entradas em WriteBatches, removendo da lista as que já foram confirmadas."""
+    while entries:
+        # Cada dia presente no lote soma uma escrita (contadores) ao limite de BATCH_SIZE.
+        size, days = 0, set()
+        while size < len(entries) and size + len(days | {_day_key(entries[size][1]["timestamp"])}) < BATCH_SIZE:
+            days.add(_day_key(entries[size][1]["timestamp"]))
+            size += 1
+        _commit_chunk(entries[:size])
+        del entries[:size]
+
+def write(entries):
+    """Grava imediatamente os logs [(log_id, dados)]; logs já gravados são ignorados."""
+    _commit(list(entries))
+
+def _write_fallback(entries):
+    try:
+        os.makedirs(os.path.dirname(FALLBACK_PATH), exist_ok=True)
+        with open(FALLBACK_PATH, "a", encoding="utf-8") as f:
+            for log_id, log_data in entries:
+                record = {**log_data, "timestamp": log_data["timestamp"].isoformat(), "log_id": log_id}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return True
+    except OSError as e:
+        print(f"Erro ao gravar logs de auditoria no arquivo local: {e}")
+        return False
+
+def _read_fallback(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            log_id = record.pop("log_id", None)
+            record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            entries.append((log_id, record))
+    return entries
+
+def _replay_fallback():
+    """Reenvia ao Firestore os logs guardados no arquivo local durante uma falha."""
+    if not os.path.exists(FALLBACK_PATH):
+        return
+    replay_path = f"{FALLBACK_PATH}.{os.getpid()}.{int(time.time())}"
+    os.replace(FALLBACK_PATH, replay_path)
+    try:
+        entries = _read_fallback(replay_path)
+    except Exception:
+        # Arquivo ilegível: devolve o conteúdo ao arquivo principal para a próxima tentativa.
+        with open(replay_path, encoding="utf-8") as src, open(FALLBACK_PATH, "a", encoding="utf-8") as dst:
+            dst.write(src.read())
+        os.remove(replay_path)
+        raise
+    try:
+        _commit(entries)
+    finally:
+        # Apenas as entradas ainda não confirmadas voltam para o arquivo principal.
+        if not entries or _write_fallback(entries):
+            os.remove(replay_path)
+
+def flush():
+    """Grava no Firestore todos os logs pendentes; em caso de falha, guarda-os no arquivo local."""
+    with _flush_lock:
+        with _buffer_lock:
+            entries = _buffer[:]
+            _buffer.clear()
+        if entries:
+            try:
+                _commit(entries)
+            except Exception as e:
+                # Apenas as entradas ainda não confirmadas vão para o arquivo local.
+                print(f"Firestore indisponível; {len(entries)} log(s) de auditoria guardado(s) localmente: {e}")
+                _write_fallback(entries)
+                return
+        try:
+            _replay_fallback()
+        except Exception as e:
+            print(f"Erro ao reenviar logs de auditoria guardados localmente: {e}")
+
+atexit.register(flush)
@@ -1,15 +1,29 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pyotp
-import bcrypt
-from . import firestore_service as fs
-from .firebase_config import auth_client, set_custom_claims
+import threading
+import time
+from collections import deque
+from . import firestore_service as fs, password_hasher, session_tokens, export_service
+from .firebase_config import auth_client, set_custom_claims, get_custom_claims
+
+# Limite de tentativas de login com senha errada por e-mail, dentro da janela.
+LOGIN_MAX_FAILURES = 5
+LOGIN_WINDOW_SECONDS = 5 * 60
+LOGIN_TRACKED_EMAILS = 10000
+
+# Resultado de verify_user_password quando o pool de bcrypt está saturado.
+LOGIN_BUSY = "busy"
+
+_login_failures = {}  # e-mail -> deque de instantes das falhas recentes
+_login_failures_lock = threading.Lock()
 
 def create_user_with_password(email, password, role, gestor_uid=None, etrac_api_key=None):
     try:
+        # O hash vem antes do usuário no Auth: se o pool estiver ocupado, nada é criado.
+        password_hash = password_hasher.hash_password(password)
         user = auth_client.create_user(email=email)
         set_custom_claims(user.uid, role, gestor_uid)
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         fs.create_firestore_user(user.uid, email, role, password_hash, gestor_uid, etrac_api_key)
         return user
     except Exception as e:
@@ -20,6 +34,8 @@ def set_user_disabled_status(uid, is_disabled: bool):
     """Habilita ou desabilita um usuário no Firebase Authentication."""
     try:
         auth_client.update_user(uid, disabled=is_disabled)
+        if is_disabled:
+            session_tokens.revoke(uid)
         return True
     except Exception as e:
         st.error(f"Erro ao alterar status do usuário: {e}")
@@ -34,6 +50,8 @@ def update_auth_user(uid, email=None, password=None):
             auth_client.update_user(uid, email=email)
         elif password:
             auth_client.update_user(uid, password=password)
+        if password:
+            session_tokens.revoke(uid)
         return True
     except Exception as e:
         st.error(f"Erro ao atualizar dados de autenticação: {e}")
@@ -41,21 +59,79 @@ def update_auth_user(uid, email=None, password=None):
 
 def update_user_role_and_claims(uid, new_role, new_gestor_uid=None):
     set_custom_claims(uid, new_role, new_gestor_uid)
+    # As sessões abertas carregam as claims antigas no token.
+    session_tokens.revoke(uid)
+
+def _login_key(email):
+    return (email or "").strip().lower()
+
+def _recent_failures(key, now):
+    failures = _login_failures.get(key)
+    while failures and now - failures[0] > LOGIN_WINDOW_SECONDS:
+        failures.popleft()
+    if failures is not None and not failures:
+        del _login_failures[key]
+        return None
+    return failures
+
+def login_retry_after(email):
+    """Segundos até o e-mail poder tentar login de novo (0 se não estiver bloqueado)."""
+    key, now = _login_key(email), time.monotonic()
+    with _login_failures_lock:
+        failures = _recent_failures(key, now)
+        if not failures or len(failures) < LOGIN_MAX_FAILURES:
+            return 0
+        return max(0, LOGIN_WINDOW_SECONDS - (now - failures[0]))
+
+def _register_login_result(email, success):
+    key, now = _login_key(email), time.monotonic()
+    with _login_failures_lock:
+        if success:
+            _login_failures.pop(key, None)
+        else:
+            _recent_failures(key, now)
+            _login_failures.setdefault(key, deque(maxlen=LOGIN_MAX_FAILURES)).append(now)
+            if len(_login_failures) > LOGIN_TRACKED_EMAILS:
+                # Descarta os e-mails cujas falhas já saíram da janela.
+                for stale_key in [k for k, f in _login_failures.items() if not f or now - f[-1] > LOGIN_WINDOW_SECONDS]:
+                    del _login_failures[stale_key]
 
 def verify_user_password(email, password):
+    """
+    Confere e-mail e senha. O bcrypt roda no pool de processos do password_hasher;
+    hashes com custo diferente de BCRYPT_ROUNDS são refeitos após o login.
+    E-mails com muitas falhas recentes são recusados sem consultar o Firestore.
+    Retorna o registro do usuário, None para credenciais inválidas ou LOGIN_BUSY
+    se a verificação não pôde ser feita agora.
+    """
+    if login_retry_after(email):
+        return None
     user_auth_record = fs.get_user_by_email(email)
-    if user_auth_record:
-        stored_hash = user_auth_record.get("password_hash")
-        if stored_hash and bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8')):
-            return user_auth_record
-    return None
+    if not user_auth_record:
+        _register_login_result(email, False)
+        return None
+    stored_hash = user_auth_record.get("password_hash")
+    try:
+        valid = password_hasher.check_password(password, stored_hash)
+    except password_hasher.HasherBusy:
+        return LOGIN_BUSY
+    _register_login_result(email, valid)
+    if not valid:
+        return None
+    if password_hasher.needs_rehash(stored_hash):
+        try:
+            fs.update_user_data(user_auth_record['uid'], {'password_hash': password_hasher.hash_password(password)})
+        except Exception as e:
+            print(f"Erro ao atualizar o custo do hash de senha de {email}: {e}")
+    return user_auth_record
 
 def generate_totp_secret(): return pyotp.random_base32()
 def get_totp_uri(email, secret): return pyotp.totp.TOTP(secret).provisioning_uri(name=email, issuer_name="ChecklistApp")
 def enable_user_totp(uid, secret): fs.update_user_totp_info(uid, secret, enabled=True)
 
-def verify_totp_code(uid, code):
-    user_data = fs.get_user(uid)
+def verify_totp_code(uid, code, user_data=None):
+    """Confere o código 2FA; `user_data` (já lido no login) evita reler o documento do usuário."""
+    user_data = user_data or fs.get_user(uid)
     if user_data and user_data.get('totp_enabled'):
         secret = user_data.get('totp_secret')
         totp = pyotp.TOTP(secret)
@@ -66,19 +142,72 @@ def verify_totp_code_with_secret(secret, code):
     totp = pyotp.TOTP(secret)
     return totp.verify(code)
 
-def is_totp_enabled(uid):
-    user_data = fs.get_user(uid)
+def is_totp_enabled(uid, user_data=None):
+    user_data = user_data or fs.get_user(uid)
     return user_data.get('totp_enabled', False) if user_data else False
 
+def start_session(user_data):
+    """
+    Conclui o login: emite o token de sessão assinado a partir das custom claims
+    do usuário (com fallback para o papel gravado no Firestore) e guarda os dados
+    na sessão. A partir daí as páginas autorizam apenas pelo token.
+    """
+    uid = user_data['uid']
+    try:
+        claims = get_custom_claims(uid)
+    except Exception as e:
+        print(f"Erro ao ler custom claims de {uid}: {e}")
+        claims = {}
+    if not claims.get('role'):
+        claims = {'role': user_data.get('role'), 'gestor_uid': user_data.get('gestor_uid')}
+    session_user = {key: value for key, value in user_data.items() if key not in ('password_hash', 'totp_secret')}
+    session_user.update({'role': claims.get('role'), 'gestor_uid': claims.get('gestor_uid')})
+    st.session_state.update({
+        'logged_in': True, 'user_uid': uid, 'user_data': session_user, 'flow': 'logged_in',
+        'session_token': session_tokens.issue(uid, claims, totp_enabled=user_data.get('totp_enabled', False)),
+    })
+    st.session_state.pop('pending_login_user', None)
+
+def refresh_session_token(totp_enabled=None):
+    """Reemite o token da sessão atual (ex: após ativar o 2FA), mantendo as claims."""
+    claims = get_session()
+    if claims:
+        totp = claims.get('totp') if totp_enabled is None else totp_enabled
+        st.session_state['session_token'] = session_tokens.issue(claims['uid'], claims, totp_enabled=totp)
+
+def get_session():
+    """Claims do token de sessão atual, ou None se ausente, expirado ou revogado."""
+    return session_tokens.verify(st.session_state.get('session_token'))
+
+def require_session(*roles):
+    """
+    Autoriza a página sem leituras no Firestore: sem sessão válida, volta ao login;
+    com um papel fora de `roles`, nega o acesso. Retorna as claims do token.
+    """
+    claims = get_session()
+    if not claims:
+        logout()
+    if roles and claims.get('role') not in roles:
+        st.error("Acesso negado.")
+        st.stop()
+    return claims
+
+def revoke_user_sessions(uid):
+    """Encerra todas as sessões abertas do usuário."""
+    session_tokens.revoke(uid)
+
 def logout():
     """Limpa todas as chaves da sessão e redireciona para a página de login."""
     keys_to_delete = [
-        'logged_in', 'user_uid', 'user_data', 'flow', 
-        'pending_login_uid', 'redirected', 
+        'logged_in', 'user_uid', 'user_data', 'flow', 'session_token',
+        'pending_login_uid', 'pending_login_user', 'redirected', 
         'impersonated_uid', 'impersonated_user_data',
-        'editing_driver_uid', 'editing_schedule_plate', 'last_log_doc',
-        'trip_summary', 'maint_check_done', 'load_vehicles_for_maint'
+        'editing_driver_uid', 'editing_schedule_plate', 'logs_nav',
+        'trip_summary', 'fleet_trip_report', 'hist_filter', 'hist_cursors', 'hist_pages', 'hist_detail', 'hist_export', 'pending_version', 'load_vehicles_for_maint'
     ]
+    # O arquivo temporário da última exportação do histórico não é mais acessível após o logout.
+    if 'hist_export' in st.session_state:
+        export_service.discard_export(st.session_state['hist_export'])
     for key in keys_to_delete:
         if key in st.session_state:
             del st.session_state[key]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import copy
+import threading
+import time
+from firebase_admin import firestore
+from .firebase_config import db
+
+# Validade máxima (em segundos) de uma configuração em memória. É só uma rede de
+# segurança: as alterações invalidam o cache pelos carimbos de versão.
+CONFIG_TTL_SECONDS = 600
+# Escopo usado para as configurações globais (sem gestor).
+GLOBAL_SCOPE = "_global"
+
+# Documento com os carimbos de versão: {tipo: {escopo: versão}}. Cada escrita de
+# configuração incrementa a versão correspondente e o listener de snapshot propaga
+# a mudança para os demais processos.
+_VERSIONS_COLLECTION, _VERSIONS_DOCUMENT = "app_configs", "config_versions"
+
+_entries = {}  # (tipo, escopo) -> (valor, versão carregada, instante da carga)
+_versions = {}  # (tipo, escopo) -> última versão conhecida
+_lock = threading.Lock()
+_listener = None
+
+def _key(kind, scope):
+    return (kind, scope or GLOBAL_SCOPE)
+
+def _on_versions_snapshot(doc_snapshots, changes, read_time):
+    for snapshot in doc_snapshots:
+        data = snapshot.to_dict() or {}
+        with _lock:
+            for kind, scopes in data.items():
+                if isinstance(scopes, dict):
+                    for scope, version in scopes.items():
+                        _versions[(kind, scope)] = version
+
+def start_listener():
+    """Inicia (uma única vez por processo) o listener dos carimbos de versão."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        _listener = False
+    try:
+        listener = db.collection(_VERSIONS_COLLECTION).document(_VERSIONS_DOCUMENT).on_snapshot(_on_versions_snapshot)
+        with _lock:
+            _listener = listener
+    except Exception as e:
+        # Sem listener, as outras instâncias dependem apenas da validade (TTL).
+        print(f"Erro ao iniciar o listener de configurações: {e}")
+
+def get(kind, scope, loader):
+    """
+    Retorna a configuração (tipo, escopo) do cache em memória, chamando `loader()`
+    apenas quando ela ainda não foi carregada, expirou ou teve a versão alterada.
+    O valor devolvido é uma cópia, então o chamador pode modificá-lo livremente.
+    """
+    start_listener()
+    key = _key(kind, scope)
+    with _lock:
+        entry = _entries.get(key)
+        version = _versions.get(key, 0)
+    if entry and entry[1] == version and time.monotonic() - entry[2] < CONFIG_TTL_SECONDS:
+        return copy.deepcopy(entry[0])
+
+    value = loader()
+    with _lock:
+        _entries[key] = (value, version, time.monotonic())
+    return copy.deepcopy(value)
+
+def invalidate(kind, scope=None, publish=True):
+    """
+    Descarta a configuração do cache local e, com `publish`, incrementa o carimbo de
+    versão no Firestore para que os outros processos também a recarreguem.
+    """
+    key = _key(kind, scope)
+    with _lock:
+        _entries.pop(key, None)
+    if publish:
+        try:
+            db.collection(_VERSIONS_COLLECTION).document(_VERSIONS_DOCUMENT).set(
+                {key[0]: {key[1]: firestore.Increment(1)}}, merge=True
+            )
+        except Exception as e:
+            print(f"Erro ao publicar nova versão da configuração {kind}: {e}")
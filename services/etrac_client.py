@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import atexit
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configurações do pool de conexões compartilhado com a API eTrac.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+MAX_CONCURRENT_PER_HOST = 16
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+# Quantidade máxima de sessões (credenciais) mantidas abertas; as menos usadas são fechadas.
+MAX_SESSIONS = 64
+
+_sessions = OrderedDict()  # (email, api_key) -> sessão
+_sessions_lock = threading.Lock()
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def _build_session(email, api_key):
+    """Cria uma sessão HTTP keep-alive com retentativas e autenticação fixa."""
+    retry = Retry(
+        total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_FORCELIST,
+        # Os endpoints da eTrac são consultas via POST, portanto é seguro repeti-las.
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.auth = (email, api_key)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_session(email, api_key):
+    """Retorna a sessão do processo associada às credenciais, criando-a se necessário."""
+    key = (email, api_key)
+    evicted = []
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _build_session(email, api_key)
+            while len(_sessions) > MAX_SESSIONS:
+                evicted.append(_sessions.popitem(last=False)[1])
+        else:
+            _sessions.move_to_end(key)
+    for old_session in evicted:
+        old_session.close()
+    return session
+
+def _get_host_semaphore(url):
+    host = urlparse(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        with _host_semaphores_lock:
+            semaphore = _host_semaphores.setdefault(host, threading.BoundedSemaphore(MAX_CONCURRENT_PER_HOST))
+    return semaphore
+
+def post(email, api_key, url, json=None, timeout=15):
+    """Executa um POST reutilizando o pool de conexões, limitado por host."""
+    session = get_session(email, api_key)
+    with _get_host_semaphore(url):
+        return session.post(url, json=json, timeout=timeout)
+
+def close_all_sessions():
+    """Fecha todas as sessões abertas (registrada para o encerramento do processo)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+atexit.register(close_all_sessions)
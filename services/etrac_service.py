@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import requests
+from . import etrac_client, trip_store
+
+class EtracApiError(Exception):
+    """A API eTrac respondeu com um erro (mesmo com HTTP 200)."""
 
 def get_vehicles_from_etrac(email, api_key):
     """Busca as últimas posições da frota completa."""
     url = "http://api.etrac.com.br/monitoramento/ultimas-posicoes"
     try:
-        response = requests.post(url, auth=(email, api_key), timeout=15)
+        response = etrac_client.post(email, api_key, url, timeout=15)
         response.raise_for_status()
         response_data = response.json()
         vehicle_list = response_data.get('retorno')
@@ -29,7 +33,7 @@ def get_single_vehicle_position(email, api_key, plate):
     """Busca a última posição de um único veículo."""
     url = "http://api.etrac.com.br/monitoramento/ultimaposicao"
     try:
-        response = requests.post(url, auth=(email, api_key), json={"placa": plate}, timeout=10)
+        response = etrac_client.post(email, api_key, url, json={"placa": plate}, timeout=10)
         response.raise_for_status()
         response_data = response.json()
         # A resposta para um único veículo pode não estar aninhada
@@ -37,15 +41,34 @@ def get_single_vehicle_position(email, api_key, plate):
     except Exception:
         return None # Retorna None em caso de qualquer erro
 
-def get_trip_summary(email, api_key, plate, date):
-    """Busca o resumo de viagens de um veículo para uma data específica."""
+def fetch_trip_summary(email, api_key, plate, date):
+    """Busca o resumo de viagens sem interagir com a UI; propaga exceções ao chamador."""
     url = "http://api.etrac.com.br/monitoramento/resumoviagens"
     formatted_date = date.strftime("%d-%m-%Y")
+    response = etrac_client.post(email, api_key, url, json={"placa": plate, "data": formatted_date}, timeout=20)
+    response.raise_for_status()
+    response_data = response.json()
+    if not isinstance(response_data, dict) or response_data.get('erro'):
+        raise EtracApiError(response_data.get('erro') if isinstance(response_data, dict) else "resposta inesperada")
+    trips = response_data.get('conducoes') or []
+    if not isinstance(trips, list):
+        raise EtracApiError("resposta inesperada")
+    return trips
+
+def get_trip_summary(email, api_key, plate, date):
+    """
+    Busca o resumo de viagens de um veículo para uma data específica.
+    Dias encerrados são lidos do armazenamento local do gestor; a API só é
+    consultada para dias ainda não armazenados ou para o dia corrente.
+    """
+    if trip_store.is_immutable(date):
+        stored_trips = trip_store.get(email, plate, date)
+        if stored_trips is not None:
+            return stored_trips
     try:
-        response = requests.post(url, auth=(email, api_key), json={"placa": plate, "data": formatted_date}, timeout=20)
-        response.raise_for_status()
-        response_data = response.json()
-        return response_data.get('conducoes', [])
+        trips = fetch_trip_summary(email, api_key, plate, date)
     except Exception as e:
         st.error(f"Não foi possível buscar o resumo de viagens: {e}")
         return []
+    trip_store.put(email, plate, date, trips)
+    return trips
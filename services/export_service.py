@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import os
+from . import firestore_service
+
+# Documentos lidos do Firestore por página durante a exportação.
+EXPORT_PAGE_SIZE = 500
+CHECKLIST_STATUSES = ["Aprovado", "Pendente", "Aprovado pelo Gestor", "Reprovado pelo Gestor"]
+
+# Layouts de exportação: uma linha por checklist ou uma linha por item verificado.
+LAYOUT_SUMMARY = "resumo"
+LAYOUT_ITEMS = "itens"
+
+SUMMARY_COLUMNS = [
+    "checklist_id", "timestamp", "vehicle_plate", "driver_email", "status", "location_status",
+    "failed_items", "total_items", "approved_by", "approval_timestamp", "notes",
+]
+ITEM_COLUMNS = [
+    "checklist_id", "timestamp", "vehicle_plate", "driver_email", "status", "location_status",
+    "item", "item_status", "photo_url",
+]
+_TIMESTAMP_COLUMNS = {"timestamp", "approval_timestamp"}
+_INTEGER_COLUMNS = {"failed_items", "total_items"}
+
+def _item_status(item_data):
+    # Checklists antigos guardam o item como texto simples ("OK"/"Não OK").
+    return item_data.get('status') if isinstance(item_data, dict) else item_data
+
+def _summary_rows(checklist):
+    items = checklist.get('items') or {}
+    return [{
+        "checklist_id": checklist.get('doc_id'), "timestamp": checklist.get('timestamp'),
+        "vehicle_plate": checklist.get('vehicle_plate'), "driver_email": checklist.get('driver_email'),
+        "status": checklist.get('status'), "location_status": checklist.get('location_status'),
+        "failed_items": sum(1 for item in items.values() if _item_status(item) == "Não OK"),
+        "total_items": len(items), "approved_by": checklist.get('approved_by'),
+        "approval_timestamp": checklist.get('approval_timestamp'), "notes": checklist.get('notes'),
+    }]
+
+def _item_rows(checklist):
+    base = {
+        "checklist_id": checklist.get('doc_id'), "timestamp": checklist.get('timestamp'),
+        "vehicle_plate": checklist.get('vehicle_plate'), "driver_email": checklist.get('driver_email'),
+        "status": checklist.get('status'), "location_status": checklist.get('location_status'),
+    }
+    return [
+        {**base, "item": item_name, "item_status": _item_status(item_data),
+         "photo_url": item_data.get('photo_url') if isinstance(item_data, dict) else None}
+        for item_name, item_data in (checklist.get('items') or {}).items()
+    ]
+
+def iter_row_pages(gestor_uid, layout=LAYOUT_SUMMARY, start_date=None, end_date=None, statuses=None, page_size=EXPORT_PAGE_SIZE):
+    """Gera as linhas da exportação em blocos, um por página lida do Firestore."""
+    build_rows = _item_rows if layout == LAYOUT_ITEMS else _summary_rows
+    for page in firestore_service.iter_checklist_pages(gestor_uid, start_date=start_date, end_date=end_date, statuses=statuses, page_size=page_size):
+        yield [row for checklist in page for row in build_rows(checklist)]
+
+def columns_for(layout):
+    return ITEM_COLUMNS if layout == LAYOUT_ITEMS else SUMMARY_COLUMNS
+
+def _csv_records(columns, rows):
+    for row in rows:
+        yield {
+            column: row[column].isoformat() if column in _TIMESTAMP_COLUMNS and row.get(column) is not None else row.get(column)
+            for column in columns
+        }
+
+def write_csv(file, gestor_uid, layout=LAYOUT_SUMMARY, start_date=None, end_date=None, statuses=None, page_size=EXPORT_PAGE_SIZE):
+    """Escreve o CSV em um arquivo binário aberto, página por página. Retorna o total de linhas."""
+    columns = columns_for(layout)
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    writer = csv.DictWriter(text, fieldnames=columns)
+    writer.writeheader()
+    total_rows = 0
+    for rows in iter_row_pages(gestor_uid, layout, start_date, end_date, statuses, page_size):
+        writer.writerows(_csv_records(columns, rows))
+        total_rows += len(rows)
+    text.flush()
+    text.detach()
+    return total_rows
+
+def _parquet_schema(columns):
+    import pyarrow as pa
+    fields = []
+    for column in columns:
+        if column in _TIMESTAMP_COLUMNS:
+            fields.append(pa.field(column, pa.timestamp("us", tz="UTC")))
+        elif column in _INTEGER_COLUMNS:
+            fields.append(pa.field(column, pa.int32()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+def write_parquet(file, gestor_uid, layout=LAYOUT_SUMMARY, start_date=None, end_date=None, statuses=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Escreve o Parquet em um arquivo (caminho ou objeto binário), um row group por
+    página lida do Firestore. Retorna o total de linhas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = columns_for(layout)
+    schema = _parquet_schema(columns)
+    total_rows = 0
+    with pq.ParquetWriter(file, schema, compression="snappy") as writer:
+        for rows in iter_row_pages(gestor_uid, layout, start_date, end_date, statuses, page_size):
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                total_rows += len(rows)
+    return total_rows
+
+def export_checklists(file, gestor_uid, file_format="csv", **filters):
+    """Exporta o histórico filtrado em CSV ou Parquet para `file`. Retorna o total de linhas."""
+    if file_format == "parquet":
+        return write_parquet(file, gestor_uid, **filters)
+    return write_csv(file, gestor_uid, **filters)
+
+def discard_export(export):
+    """Apaga o arquivo temporário de uma exportação anterior ({'path': ...}), se ainda existir."""
+    if export and export.get('path'):
+        try:
+            os.remove(export['path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Erro ao remover o arquivo de exportação {export['path']}: {e}")
@@ -34,3 +34,6 @@ def set_custom_claims(uid, role, gestor_uid=None):
     if gestor_uid:
         claims['gestor_uid'] = gestor_uid
     auth_client.set_custom_user_claims(uid, claims)
+
+def get_custom_claims(uid):
+    return auth_client.get_user(uid).custom_claims or {}
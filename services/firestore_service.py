@@ -1,12 +1,106 @@
 # -*- coding: utf-8 -*-
+import threading
+import time
 from datetime import datetime
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
 from .firebase_config import db
+from . import audit_logger, config_cache
+
+# Quantidade de documentos por chamada de db.get_all.
+GET_ALL_CHUNK_SIZE = 100
+# Validade (em segundos) do cache em memória de usuários resolvidos em lote.
+USER_CACHE_TTL_SECONDS = 300
+
+# Campos sensíveis que nunca ficam no cache compartilhado entre as sessões.
+USER_CACHE_EXCLUDED_FIELDS = ("password_hash", "totp_secret", "etrac_api_key")
+
+_user_cache = {}  # uid -> (timestamp, dados do usuário sem campos sensíveis, ou None)
+_user_cache_lock = threading.Lock()
+# Credenciais de acesso do gestor (e-mail e chave da eTrac) usadas pelo painel do
+# motorista, mantidas à parte do cache de usuários e por pouco tempo.
+GESTOR_ACCESS_TTL_SECONDS = 60
+GESTOR_ACCESS_FIELDS = ("email", "etrac_api_key", "notification_digest_minutes")
+_gestor_access_cache = {}  # gestor_uid -> (timestamp, credenciais ou None)
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _get_docs_by_ids(collection_name, doc_ids):
+    """Lê vários documentos de uma coleção em chamadas db.get_all agrupadas."""
+    docs = {}
+    collection = db.collection(collection_name)
+    for chunk in _chunks(list(doc_ids), GET_ALL_CHUNK_SIZE):
+        refs = [collection.document(doc_id) for doc_id in chunk]
+        for snapshot in db.get_all(refs):
+            docs[snapshot.id] = snapshot.to_dict() if snapshot.exists else None
+    return docs
+
+def _invalidate_user_cache(uid):
+    with _user_cache_lock:
+        _user_cache.pop(uid, None)
+        _gestor_access_cache.pop(uid, None)
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+        _gestor_access_cache.clear()
 
 def get_user(uid):
     doc_ref = db.collection("users").document(uid).get()
     return doc_ref.to_dict() if doc_ref.exists else None
 
+def get_gestor_access(gestor_uid):
+    """
+    Retorna {'email', 'etrac_api_key', 'notification_digest_minutes'} do gestor, ou
+    None se ele não existir. O resultado fica em cache por GESTOR_ACCESS_TTL_SECONDS,
+    evitando ler o documento do gestor a cada renderização do painel do motorista.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _gestor_access_cache.get(gestor_uid)
+        if entry and now - entry[0] <= GESTOR_ACCESS_TTL_SECONDS:
+            return dict(entry[1]) if entry[1] else None
+    doc = db.collection("users").document(gestor_uid).get(field_paths=list(GESTOR_ACCESS_FIELDS))
+    access = {field: (doc.to_dict() or {}).get(field) for field in GESTOR_ACCESS_FIELDS} if doc.exists else None
+    with _user_cache_lock:
+        for uid in [uid for uid, cached in _gestor_access_cache.items() if now - cached[0] > GESTOR_ACCESS_TTL_SECONDS]:
+            del _gestor_access_cache[uid]
+        _gestor_access_cache[gestor_uid] = (now, access)
+    return dict(access) if access else None
+
+def get_users_by_uids(uids):
+    """
+    Resolve vários usuários de uma vez, retornando {uid: dados}. UIDs inexistentes
+    são mapeados para None. Resultados ficam em cache por USER_CACHE_TTL_SECONDS,
+    sem os campos de USER_CACHE_EXCLUDED_FIELDS (use `get_user` para lê-los).
+    """
+    uids = {uid for uid in uids if uid and isinstance(uid, str)}
+    now = time.monotonic()
+    resolved, missing = {}, []
+    with _user_cache_lock:
+        for uid in uids:
+            entry = _user_cache.get(uid)
+            if entry and now - entry[0] <= USER_CACHE_TTL_SECONDS:
+                resolved[uid] = entry[1]
+            else:
+                missing.append(uid)
+    if missing:
+        fetched = _get_docs_by_ids("users", missing)
+        with _user_cache_lock:
+            # Descarta as entradas vencidas para o cache não crescer com todo usuário já resolvido.
+            for uid in [uid for uid, entry in _user_cache.items() if now - entry[0] > USER_CACHE_TTL_SECONDS]:
+                del _user_cache[uid]
+            for uid in missing:
+                user_data = fetched.get(uid)
+                if user_data is not None:
+                    user_data = {key: value for key, value in user_data.items() if key not in USER_CACHE_EXCLUDED_FIELDS}
+                    user_data['uid'] = uid
+                _user_cache[uid] = (now, user_data)
+                resolved[uid] = user_data
+    return {uid: dict(user_data) if user_data else None for uid, user_data in resolved.items()}
+
 def get_all_users():
     users_ref = db.collection("users").stream()
     users_list = []
@@ -54,38 +148,212 @@ def create_firestore_user(uid, email, role, password_hash, gestor_uid=None, etra
     if etrac_api_key:
         user_data['etrac_api_key'] = etrac_api_key
     db.collection("users").document(uid).set(user_data)
+    _invalidate_user_cache(uid)
 
 def update_user_data(uid, data_to_update):
     db.collection("users").document(uid).update(data_to_update)
+    _invalidate_user_cache(uid)
 
 def update_user_totp_info(uid, secret, enabled):
     db.collection("users").document(uid).update({'totp_secret': secret, 'totp_enabled': enabled})
+    _invalidate_user_cache(uid)
 
-def log_action(user_email, action, details):
-    log_data = {"timestamp": datetime.now(), "user": user_email, "action": action, "details": details}
-    db.collection("logs").add(log_data)
+def log_action(user_email, action, details, timestamp=None, log_id=None, buffered=True):
+    """
+    Registra um log de auditoria. Por padrão o log entra no buffer do audit_logger
+    e é gravado em lote em segundo plano; com `buffered=False` a gravação é imediata
+    (usado pela outbox, que só conclui a tarefa depois da escrita).
+    """
+    if buffered:
+        audit_logger.log(user_email, action, details, timestamp=timestamp, log_id=log_id)
+        return
+    log_data = {"timestamp": timestamp or datetime.now(), "user": user_email, "action": action, "details": details}
+    # Um ID fixo torna a gravação idempotente quando o log é reprocessado.
+    audit_logger.write([(log_id or db.collection("logs").document().id, log_data)])
 
-def get_logs_paginated(limit=20, start_after_doc=None):
-    query = db.collection("logs").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
-    if start_after_doc:
-        query = query.start_after(start_after_doc)
-    return query.get()
+def _logs_query(user=None, action=None, start_date=None, end_date=None, descending=True):
+    """
+    Consulta de logs com filtros de igualdade em user/action e intervalo de data,
+    ordenada por timestamp. Os filtros combinados usam os índices compostos
+    (user, timestamp), (action, timestamp) e (user, action, timestamp), nos dois
+    sentidos de ordenação, definidos em firestore.indexes.json (`firebase deploy --only firestore:indexes`).
+    """
+    query = db.collection("logs")
+    if user:
+        query = query.where("user", "==", user)
+    if action:
+        query = query.where("action", "==", action)
+    if start_date:
+        query = query.where("timestamp", ">=", start_date)
+    if end_date:
+        query = query.where("timestamp", "<=", end_date)
+    return query.order_by("timestamp", direction=firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING)
+
+def get_logs_page(limit=20, after_doc=None, before_doc=None, user=None, action=None, start_date=None, end_date=None):
+    """
+    Paginação por cursor nos dois sentidos, do log mais recente para o mais antigo.
+    `after_doc` (último documento da página atual) avança para logs mais antigos;
+    `before_doc` (primeiro documento da página atual) volta para logs mais recentes.
+
+    Returns:
+        (logs, first_doc, last_doc, has_more): os logs da página, os documentos das
+        pontas (cursores) e se ainda há logs no sentido em que se navegou. Se a
+        consulta falhar (ex: índice composto de firestore.indexes.json ainda não
+        criado), `logs` é None.
+    """
+    if before_doc:
+        query = _logs_query(user, action, start_date, end_date, descending=False).start_after(before_doc)
+    else:
+        query = _logs_query(user, action, start_date, end_date)
+        if after_doc:
+            query = query.start_after(after_doc)
+    try:
+        docs = list(query.limit(limit + 1).get())
+    except Exception as e:
+        print(f"Erro ao buscar logs: {e}")
+        return None, None, None, False
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if before_doc:
+        docs.reverse()
+    logs = [{**doc.to_dict(), 'doc_id': doc.id} for doc in docs]
+    return logs, (docs[0] if docs else None), (docs[-1] if docs else None), has_more
+
+def count_logs(user=None, action=None, start_date=None, end_date=None):
+    """Total de logs que atendem aos filtros, via agregação no servidor (sem ler os documentos)."""
+    try:
+        result = _logs_query(user, action, start_date, end_date).count().get()
+        return int(result[0][0].value)
+    except Exception as e:
+        print(f"Erro ao contar logs: {e}")
+        return None
+
+def rebuild_log_stats():
+    """
+    Recalcula do zero os contadores diários de log_stats a partir dos logs
+    existentes (backfill dos logs gravados antes dos contadores). Logs gravados
+    durante a execução podem precisar de uma nova reconstrução.
+    """
+    days = {}
+    for doc in db.collection("logs").select(["timestamp", "user", "action"]).stream():
+        log_data = doc.to_dict()
+        if not log_data.get('timestamp'):
+            continue
+        day = log_data['timestamp'].strftime('%Y-%m-%d')
+        day_stats = days.setdefault(day, {"day": day, "total": 0, "actions": {}, "users": {}})
+        day_stats["total"] += 1
+        for field, key in (("actions", log_data.get('action')), ("users", log_data.get('user'))):
+            if key:
+                day_stats[field][key] = day_stats[field].get(key, 0) + 1
+    for old_day in db.collection("log_stats").list_documents():
+        if old_day.id not in days:
+            old_day.delete()
+    for chunk in _chunks(list(days.values()), 499):
+        batch = db.batch()
+        for day_stats in chunk:
+            batch.set(db.collection("log_stats").document(day_stats["day"]), day_stats)
+        batch.commit()
+    return len(days)
+
+def get_log_stats(start_day, end_day):
+    """
+    Soma os contadores diários de log_stats entre dois dias (inclusive), retornando
+    {'total': n, 'actions': {ação: n}, 'users': {usuário: n}, 'days': {AAAA-MM-DD: n}}.
+    """
+    query = db.collection("log_stats").where("day", ">=", start_day.strftime('%Y-%m-%d')).where("day", "<=", end_day.strftime('%Y-%m-%d'))
+    stats = {"total": 0, "actions": {}, "users": {}, "days": {}}
+    for doc in query.stream():
+        data = doc.to_dict()
+        stats["total"] += data.get("total", 0)
+        stats["days"][data.get("day", doc.id)] = data.get("total", 0)
+        for field in ("actions", "users"):
+            for key, value in (data.get(field) or {}).items():
+                stats[field][key] = stats[field].get(key, 0) + value
+    return stats
 
 def save_checklist(data):
     try:
-        _, doc_ref = db.collection("checklists").add(data)
+        doc_ref = db.collection("checklists").document()
+        batch = db.batch()
+        batch.set(doc_ref, data)
+        if _is_counted_in_bi(data.get('status')):
+            _write_bi_increments(batch, data, 1)
+        batch.commit()
         return doc_ref.id
     except Exception as e:
         print(f"Erro ao salvar checklist: {e}")
         return None
 
 def update_checklist_with_photos(doc_id, photo_updates):
-    db.collection("checklists").document(doc_id).update(photo_updates)
+    if "status" in photo_updates:
+        _update_checklist_and_bi(doc_id, photo_updates)
+    else:
+        db.collection("checklists").document(doc_id).update(photo_updates)
+
+# Campos exibidos na tabela de resumo do histórico de checklists.
+CHECKLIST_SUMMARY_FIELDS = ["timestamp", "vehicle_plate", "driver_email", "status", "location_status"]
 
-def get_checklists_for_gestor(gestor_uid):
-    query = db.collection("checklists").where("gestor_uid", "==", gestor_uid).order_by("timestamp", direction=firestore.Query.DESCENDING)
+def _checklists_query(gestor_uid, start_date=None, end_date=None, fields=None, statuses=None):
+    # Índices compostos (gestor_uid, timestamp) e (gestor_uid, status, timestamp) em firestore.indexes.json.
+    query = db.collection("checklists").where("gestor_uid", "==", gestor_uid)
+    if statuses:
+        query = query.where("status", "in", list(statuses))
+    if start_date:
+        query = query.where("timestamp", ">=", start_date)
+    if end_date:
+        query = query.where("timestamp", "<=", end_date)
+    query = query.order_by("timestamp", direction=firestore.Query.DESCENDING)
+    if fields:
+        # O campo de ordenação precisa estar na projeção para servir de cursor.
+        query = query.select(list(dict.fromkeys(["timestamp", *fields])))
+    return query
+
+def get_checklists_for_gestor(gestor_uid, start_date=None, end_date=None, fields=None):
+    query = _checklists_query(gestor_uid, start_date, end_date, fields)
     return [doc.to_dict() for doc in query.stream()]
 
+def get_checklists_page(gestor_uid, page_size=25, start_after_doc=None, start_date=None, end_date=None, fields=None, statuses=None):
+    """
+    Retorna uma página do histórico de checklists do gestor, do mais recente
+    para o mais antigo, como (checklists, cursor). O cursor é o último documento
+    da página, a ser passado em `start_after_doc`, ou None se não houver mais páginas.
+    Um documento além da página é lido só para saber se há uma próxima.
+    """
+    query = _checklists_query(gestor_uid, start_date, end_date, fields, statuses).limit(page_size + 1)
+    if start_after_doc:
+        query = query.start_after(start_after_doc)
+    docs = list(query.get())
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    checklists = []
+    for doc in docs:
+        checklist_data = doc.to_dict()
+        checklist_data['doc_id'] = doc.id
+        checklists.append(checklist_data)
+    next_cursor = docs[-1] if has_more else None
+    return checklists, next_cursor
+
+def iter_checklist_pages(gestor_uid, start_date=None, end_date=None, statuses=None, fields=None, page_size=500):
+    """
+    Percorre o histórico de checklists do gestor página por página (listas de até
+    `page_size` documentos), sem manter o histórico inteiro em memória.
+    """
+    cursor = None
+    while True:
+        page, cursor = get_checklists_page(gestor_uid, page_size=page_size, start_after_doc=cursor, start_date=start_date, end_date=end_date, fields=fields, statuses=statuses)
+        if page:
+            yield page
+        if cursor is None:
+            break
+
+def get_checklist(doc_id):
+    doc_ref = db.collection("checklists").document(doc_id).get()
+    if not doc_ref.exists:
+        return None
+    checklist_data = doc_ref.to_dict()
+    checklist_data['doc_id'] = doc_ref.id
+    return checklist_data
+
 def get_pending_checklists_for_gestor(gestor_uid):
     query = db.collection("checklists").where("gestor_uid", "==", gestor_uid).where("status", "==", "Pendente").order_by("timestamp", direction=firestore.Query.DESCENDING)
     checklists = []
@@ -96,16 +364,139 @@ def get_pending_checklists_for_gestor(gestor_uid):
     return checklists
 
 def update_checklist_status(doc_id, new_status, approver_email):
-    db.collection("checklists").document(doc_id).update({
+    _update_checklist_and_bi(doc_id, {
         "status": new_status, "approved_by": approver_email, "approval_timestamp": datetime.now()
     })
 
-def get_checklist_template(gestor_uid=None):
-    if gestor_uid:
-        doc_ref = db.collection("checklist_templates").document(gestor_uid).get()
-        if doc_ref.exists:
-            return doc_ref.to_dict().get("items", [])
-    
+# --- Agregados de BI ---
+# bi_aggregates/{gestor_uid} guarda os totais de falhas por item e por placa;
+# bi_aggregates/{gestor_uid}/days/{AAAA-MM-DD} guarda os mesmos contadores por dia.
+# Um checklist conta como inconformidade enquanto seu status não for de aprovação.
+
+def _is_counted_in_bi(status):
+    return bool(status) and 'Aprovado' not in status
+
+def _failure_counts(checklist_data, delta):
+    counts = {}
+    plate = checklist_data.get('vehicle_plate')
+    if plate:
+        counts["failed_vehicles"] = {plate: delta}
+    failed_items = {}
+    for item, item_data in checklist_data.get('items', {}).items():
+        status = item_data.get('status') if isinstance(item_data, dict) else item_data
+        if status == 'Não OK':
+            failed_items[item] = failed_items.get(item, 0) + delta
+    if failed_items:
+        counts["failed_items"] = failed_items
+    return counts
+
+def _bi_day_key(timestamp):
+    return timestamp.strftime('%Y-%m-%d')
+
+def _write_bi_increments(writer, checklist_data, delta):
+    """Aplica os contadores de um checklist via `writer` (WriteBatch ou Transaction)."""
+    gestor_uid = checklist_data.get('gestor_uid')
+    counts = _failure_counts(checklist_data, delta)
+    if not gestor_uid or not counts:
+        return
+    increments = {field: {key: firestore.Increment(value) for key, value in values.items()} for field, values in counts.items()}
+    day = _bi_day_key(checklist_data['timestamp'])
+    agg_ref = db.collection("bi_aggregates").document(gestor_uid)
+    writer.set(agg_ref, {**increments, "gestor_uid": gestor_uid}, merge=True)
+    writer.set(agg_ref.collection("days").document(day), {**increments, "day": day}, merge=True)
+
+@firestore.transactional
+def _update_checklist_and_bi_transaction(transaction, doc_ref, updates):
+    snapshot = doc_ref.get(transaction=transaction)
+    old_data = snapshot.to_dict() if snapshot.exists else None
+    transaction.update(doc_ref, updates)
+    if not old_data:
+        return
+    was_counted = _is_counted_in_bi(old_data.get('status'))
+    is_counted = _is_counted_in_bi(updates.get('status', old_data.get('status')))
+    if was_counted != is_counted:
+        _write_bi_increments(transaction, old_data, 1 if is_counted else -1)
+
+def _update_checklist_and_bi(doc_id, updates):
+    doc_ref = db.collection("checklists").document(doc_id)
+    _update_checklist_and_bi_transaction(db.transaction(), doc_ref, updates)
+
+def rebuild_bi_aggregates(gestor_uid):
+    """
+    Recalcula do zero os agregados de BI de um gestor a partir dos checklists
+    existentes. Usado como backfill (ação do admin), nunca durante a renderização.
+    As gravações usam merge, zerando as chaves que deixaram de existir, para não
+    apagar campos nem chaves novas gravadas por incrementos concorrentes; ainda
+    assim, escritas durante a execução podem precisar de uma nova reconstrução.
+    """
+    totals = {"failed_items": {}, "failed_vehicles": {}}
+    days = {}
+    query = db.collection("checklists").where("gestor_uid", "==", gestor_uid).select(["status", "vehicle_plate", "items", "timestamp"])
+    for doc in query.stream():
+        checklist_data = doc.to_dict()
+        if not _is_counted_in_bi(checklist_data.get('status')) or not checklist_data.get('timestamp'):
+            continue
+        day = _bi_day_key(checklist_data['timestamp'])
+        day_counts = days.setdefault(day, {"failed_items": {}, "failed_vehicles": {}})
+        for field, values in _failure_counts(checklist_data, 1).items():
+            for key, value in values.items():
+                totals[field][key] = totals[field].get(key, 0) + value
+                day_counts[field][key] = day_counts[field].get(key, 0) + value
+
+    agg_ref = db.collection("bi_aggregates").document(gestor_uid)
+    for old_day in agg_ref.collection("days").list_documents():
+        if old_day.id not in days:
+            old_day.delete()
+    day_items = list(days.items())
+    previous_days = _get_docs_by_ids(f"bi_aggregates/{gestor_uid}/days", [day for day, _ in day_items])
+    for chunk in _chunks(day_items, 499):
+        batch = db.batch()
+        for day, day_counts in chunk:
+            batch.set(agg_ref.collection("days").document(day), {**_with_stale_keys_zeroed(day_counts, previous_days.get(day)), "day": day}, merge=True)
+        batch.commit()
+    previous_totals = agg_ref.get()
+    totals = _with_stale_keys_zeroed(totals, previous_totals.to_dict() if previous_totals.exists else None)
+    agg_ref.set({**totals, "gestor_uid": gestor_uid, "backfilled_at": datetime.now()}, merge=True)
+    return len(day_items)
+
+def _with_stale_keys_zeroed(counts, previous):
+    """Completa `counts` com zero para as chaves que existiam em `previous` e não foram recontadas."""
+    result = {}
+    for field, values in counts.items():
+        result[field] = {key: 0 for key in ((previous or {}).get(field) or {})}
+        result[field].update(values)
+    return result
+
+def get_bi_aggregates(gestor_uid, start_day=None):
+    """
+    Retorna {"failed_items": {item: n}, "failed_vehicles": {placa: n}} com os
+    contadores totais do gestor ou, se `start_day` for informado, somente os dias
+    a partir dele, além de "backfilled": se os agregados já foram reconstruídos
+    a partir do histórico (sem isso, só contam os checklists posteriores aos contadores).
+    """
+    agg_ref = db.collection("bi_aggregates").document(gestor_uid)
+    agg_doc = agg_ref.get()
+    backfilled = agg_doc.exists and bool((agg_doc.to_dict() or {}).get('backfilled_at'))
+    if start_day is None:
+        source_docs = [agg_doc.to_dict() or {}]
+    else:
+        query = agg_ref.collection("days").where("day", ">=", start_day.strftime('%Y-%m-%d'))
+        source_docs = [doc.to_dict() for doc in query.stream()]
+    result = {"failed_items": {}, "failed_vehicles": {}}
+    for source in source_docs:
+        for field in result:
+            for key, value in (source.get(field) or {}).items():
+                result[field][key] = result[field].get(key, 0) + value
+    for field in result:
+        result[field] = {key: value for key, value in result[field].items() if value > 0}
+    result["backfilled"] = backfilled
+    return result
+
+def _load_gestor_checklist_template(gestor_uid):
+    doc_ref = db.collection("checklist_templates").document(gestor_uid).get()
+    return doc_ref.to_dict().get("items", []) if doc_ref.exists else None
+
+def _load_global_checklist_template():
     doc_ref_global = db.collection("app_configs").document("checklist_template").get()
     if doc_ref_global.exists:
         return doc_ref_global.to_dict().get("items", [])
@@ -114,6 +505,17 @@ def get_checklist_template(gestor_uid=None):
     db.collection("app_configs").document("checklist_template").set({"items": default_items})
     return default_items
 
+def get_checklist_template(gestor_uid=None):
+    """
+    Retorna os itens do checklist do gestor (ou o modelo global), servidos do cache
+    de configurações; o Firestore só é lido quando o modelo muda.
+    """
+    if gestor_uid:
+        items = config_cache.get("checklist_template", gestor_uid, lambda: _load_gestor_checklist_template(gestor_uid))
+        if items is not None:
+            return items
+    return config_cache.get("checklist_template", None, _load_global_checklist_template)
+
 def update_checklist_template(items_list, gestor_uid=None):
     if gestor_uid:
         db.collection("checklist_templates").document(gestor_uid).set({
@@ -121,9 +523,21 @@ def update_checklist_template(items_list, gestor_uid=None):
         })
     else:
         db.collection("app_configs").document("checklist_template").set({"items": items_list})
+    config_cache.invalidate("checklist_template", gestor_uid)
 
-def create_maintenance_order(order_data):
-    db.collection("maintenance_orders").add(order_data)
+def create_maintenance_order(order_data, order_id=None):
+    """
+    Cria uma ordem de serviço. Com `order_id`, a criação é idempotente: retorna
+    False se uma ordem com esse ID já existir.
+    """
+    if not order_id:
+        db.collection("maintenance_orders").add(order_data)
+        return True
+    try:
+        db.collection("maintenance_orders").document(order_id).create(order_data)
+        return True
+    except AlreadyExists:
+        return False
 
 def get_maintenance_orders_for_gestor(gestor_uid):
     query = db.collection("maintenance_orders").where("gestor_uid", "==", gestor_uid).order_by("created_at", direction=firestore.Query.DESCENDING)
@@ -149,15 +563,62 @@ def get_vehicle_details_by_plate(plate):
     doc_ref = db.collection("vehicles").document(plate).get()
     return doc_ref.to_dict() if doc_ref.exists else None
 
+def get_vehicle_details_by_plates(plates):
+    """Busca os documentos vehicles/{placa} de várias placas em lote, retornando {placa: dados}."""
+    plates = {plate for plate in plates if plate}
+    return _get_docs_by_ids("vehicles", plates) if plates else {}
+
 def save_geofence_settings(lat, lon, radius):
     db.collection("app_configs").document("geofence_settings").set({
         "latitude": lat, "longitude": lon, "radius_meters": radius
     })
+    config_cache.invalidate("geofence_settings")
 
-def get_geofence_settings():
+def _load_geofence_settings():
     doc_ref = db.collection("app_configs").document("geofence_settings").get()
     return doc_ref.to_dict() if doc_ref.exists else None
 
+def get_geofence_settings():
+    return config_cache.get("geofence_settings", None, _load_geofence_settings)
+
+def _load_geofences_for_gestor(gestor_uid):
+    query = db.collection("geofences").where("gestor_uid", "==", gestor_uid).stream()
+    return [{**doc.to_dict(), 'doc_id': doc.id} for doc in query]
+
+def get_geofences_for_gestor(gestor_uid, include_global=True):
+    """
+    Retorna as cercas (círculos e polígonos) cadastradas pelo gestor, cada uma com
+    'doc_id'. Se o gestor não tiver nenhuma, usa a cerca global como fallback.
+    """
+    fences = config_cache.get("geofences", gestor_uid, lambda: _load_geofences_for_gestor(gestor_uid))
+    if not fences and include_global:
+        global_fence = get_geofence_settings()
+        if global_fence:
+            fences = [{**global_fence, 'type': 'circle', 'name': '', 'doc_id': None}]
+    return fences
+
+def save_geofence(fence_data, fence_id=None):
+    """Cria (ou atualiza, quando `fence_id` é informado) uma cerca de gestor."""
+    try:
+        if fence_id:
+            db.collection("geofences").document(fence_id).set(fence_data)
+        else:
+            db.collection("geofences").add(fence_data)
+        config_cache.invalidate("geofences", fence_data.get('gestor_uid'))
+        return True
+    except Exception as e:
+        print(f"Erro ao salvar cerca: {e}")
+        return False
+
+def delete_geofence(fence_id, gestor_uid):
+    try:
+        db.collection("geofences").document(fence_id).delete()
+        config_cache.invalidate("geofences", gestor_uid)
+        return True
+    except Exception as e:
+        print(f"Erro ao excluir cerca: {e}")
+        return False
+
 def update_maintenance_schedule(plate, data):
     data['notification_sent_for_km'] = data.get('last_maintenance_km', 0)
     db.collection("maintenance_schedules").document(plate).set(data, merge=True)
@@ -166,6 +627,25 @@ def get_maintenance_schedules_for_gestor(gestor_uid):
     query = db.collection("maintenance_schedules").where("gestor_uid", "==", gestor_uid).stream()
     return {doc.id: doc.to_dict() for doc in query}
 
+def get_all_maintenance_schedules():
+    """Retorna todos os planos de manutenção agrupados por gestor: {gestor_uid: {placa: plano}}."""
+    schedules_by_gestor = {}
+    for doc in db.collection("maintenance_schedules").stream():
+        schedule = doc.to_dict()
+        schedules_by_gestor.setdefault(schedule.get('gestor_uid'), {})[doc.id] = schedule
+    return schedules_by_gestor
+
+def update_maintenance_schedules_batch(updates_by_plate):
+    """Aplica {placa: campos} aos planos de manutenção em WriteBatches de até 500 escritas."""
+    for chunk in _chunks(list(updates_by_plate.items()), 500):
+        batch = db.batch()
+        for plate, updates in chunk:
+            batch.update(db.collection("maintenance_schedules").document(plate), updates)
+        batch.commit()
+
+def mark_maintenance_notified(plate, notified_km):
+    db.collection("maintenance_schedules").document(plate).update({"notification_sent_for_km": notified_km})
+
 def delete_maintenance_schedule(plate):
     try:
         db.collection("maintenance_schedules").document(plate).delete()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+from . import etrac_service
+
+# Janela de validade (em segundos) de uma posição da frota compartilhada entre sessões.
+FRESHNESS_SECONDS = 60
+# Quantidade máxima de gestores mantidos em memória (os menos usados são descartados).
+MAX_ENTRIES = 64
+
+_entries = OrderedDict()  # (email, api_key) -> (timestamp, lista de veículos)
+_inflight = {}  # (email, api_key) -> busca em andamento
+_lock = threading.Lock()
+
+class _InFlightFetch:
+    __slots__ = ("event", "result")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = []
+
+def get_vehicles(email, api_key, max_age=None):
+    """
+    Retorna as últimas posições da frota do gestor, servindo o mesmo snapshot
+    a todas as sessões dentro da janela de validade. Buscas simultâneas para
+    as mesmas credenciais são agrupadas em uma única chamada à eTrac.
+    """
+    if not email or not api_key:
+        return []
+    key = (email, api_key)
+    max_age = FRESHNESS_SECONDS if max_age is None else max_age
+    with _lock:
+        entry = _entries.get(key)
+        if entry and time.monotonic() - entry[0] <= max_age:
+            _entries.move_to_end(key)
+            return entry[1]
+        fetch = _inflight.get(key)
+        is_leader = fetch is None
+        if is_leader:
+            fetch = _InFlightFetch()
+            _inflight[key] = fetch
+
+    if not is_leader:
+        fetch.event.wait()
+        return fetch.result
+
+    try:
+        fetch.result = etrac_service.get_vehicles_from_etrac(email, api_key)
+    finally:
+        with _lock:
+            # Respostas vazias (erro ou frota sem veículos) não são guardadas,
+            # para que a próxima renderização tente novamente.
+            if fetch.result:
+                _entries[key] = (time.monotonic(), fetch.result)
+                _entries.move_to_end(key)
+                while len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+            _inflight.pop(key, None)
+        fetch.event.set()
+    return fetch.result
+
+def invalidate(email=None, api_key=None):
+    """Descarta o snapshot de um gestor, ou de todos se nenhuma credencial for informada."""
+    with _lock:
+        if email is None and api_key is None:
+            _entries.clear()
+        else:
+            _entries.pop((email, api_key), None)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+import time
+from datetime import datetime
+from . import firestore_service, fleet_cache, outbox_service
+from utils import fleet_util
+
+# Intervalo padrão (em segundos) entre as verificações automáticas de manutenção.
+CHECK_INTERVAL_SECONDS = 15 * 60
+
+_scheduler_thread = None
+_scheduler_lock = threading.Lock()
+
+def find_due_vehicles(schedules, vehicles):
+    """Lista os veículos que entraram na janela de alerta e ainda não foram notificados."""
+    if not schedules or not vehicles:
+        return []
+    evaluation = fleet_util.evaluate_schedules(fleet_util.build_fleet_frame(vehicles), fleet_util.build_schedule_frame(schedules))
+    due = evaluation[evaluation["is_due"]]
+    return [
+        {"placa": plate, "odometro_atual": int(row.odometro_km), "limite_km": int(row.next_maintenance_km), "plano_desc": row.notes}
+        for plate, row in zip(due.index, due.itertuples(index=False))
+    ]
+
+def _build_digest(due_vehicles):
+    subject = "Alerta de Manutenção Preventiva Próxima do Vencimento"
+    email_body = "<h3>Os seguintes veículos entraram na janela de alerta para manutenção programada:</h3><ul>"
+    for v in due_vehicles:
+        email_body += f"<li><b>Veículo:</b> {v['placa']}<br><b>Manutenção:</b> {v['plano_desc']}<br><b>Odômetro Atual:</b> {v['odometro_atual']} km<br><b>Limite:</b> {v['limite_km']} km</li>"
+    email_body += "</ul><p>Uma Ordem de Serviço foi criada automaticamente no painel de manutenção.</p>"
+    return subject, email_body
+
+def process_gestor(gestor, schedules):
+    """
+    Avalia os planos de um gestor contra o odômetro atual da frota e cria as OS
+    devidas. O ID da OS é derivado da placa e do limite de km, então sessões ou
+    processos concorrentes nunca criam a mesma OS duas vezes. Retorna as OS criadas.
+    """
+    gestor_uid, gestor_email, api_key = gestor['uid'], gestor.get('email'), gestor.get('etrac_api_key')
+    if not schedules or not gestor_email or not api_key:
+        return []
+    vehicles = fleet_cache.get_vehicles(gestor_email, api_key)
+    if not vehicles:
+        return []
+
+    # Atualiza a média de km/dia usada na previsão de vencimento dos planos.
+    km_updates = fleet_util.update_km_per_day(fleet_util.build_schedule_frame(schedules), fleet_util.build_fleet_frame(vehicles))
+    if km_updates:
+        firestore_service.update_maintenance_schedules_batch(km_updates)
+
+    created = []
+    for v in find_due_vehicles(schedules, vehicles):
+        order_id = f"preventiva-{v['placa']}-{v['limite_km']}"
+        os_data = {
+            "created_at": datetime.now(), "status": "Aberta", "vehicle_plate": v['placa'],
+            "driver_email": "SISTEMA", "gestor_uid": gestor_uid,
+            "checklist_notes": f"Manutenção preventiva por odômetro. Limite de {v['limite_km']}km se aproximando. Odômetro atual: {v['odometro_atual']}km.",
+            "failed_items": [v['plano_desc']], "maintenance_notes": ""
+        }
+        if firestore_service.create_maintenance_order(os_data, order_id=order_id):
+            created.append({**v, "order_id": order_id})
+        firestore_service.mark_maintenance_notified(v['placa'], v['limite_km'])
+
+    if created:
+        subject, email_body = _build_digest(created)
+        digest_key = "maint-" + hashlib.sha1("|".join(sorted(v['order_id'] for v in created)).encode('utf-8')).hexdigest()
+        outbox_service.enqueue_email(gestor_email, subject, email_body, idempotency_key=digest_key)
+        outbox_service.enqueue_log(gestor_email, "ALERTA_MANUTENCAO", f"{len(created)} veículos com manutenção próxima.", idempotency_key=f"{digest_key}-log")
+    return created
+
+def run_maintenance_check():
+    """Avalia os planos de todos os gestores em uma única passada. Retorna {gestor_uid: OS criadas}."""
+    schedules_by_gestor = firestore_service.get_all_maintenance_schedules()
+    results = {}
+    for gestor in firestore_service.get_all_managers():
+        try:
+            results[gestor['uid']] = process_gestor(gestor, schedules_by_gestor.get(gestor['uid'], {}))
+        except Exception as e:
+            print(f"Erro ao verificar manutenção do gestor {gestor.get('email')}: {e}")
+    return results
+
+def run_scheduler(interval_seconds=CHECK_INTERVAL_SECONDS):
+    """Executa a verificação de manutenção periodicamente (bloqueante)."""
+    while True:
+        started = time.monotonic()
+        try:
+            results = run_maintenance_check()
+            total = sum(len(created) for created in results.values())
+            print(f"[{datetime.now():%Y-%m-%d %H:%M}] Verificação de manutenção concluída: {total} OS criada(s).")
+        except Exception as e:
+            print(f"Erro na verificação de manutenção: {e}")
+        time.sleep(max(0, interval_seconds - (time.monotonic() - started)))
+
+def start_background_scheduler(interval_seconds=CHECK_INTERVAL_SECONDS):
+    """Inicia o agendador em uma thread do processo atual (uma única vez)."""
+    global _scheduler_thread
+    with _scheduler_lock:
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(target=run_scheduler, args=(interval_seconds,), name="maintenance-scheduler", daemon=True)
+            _scheduler_thread.start()
@@ -1,30 +1,90 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
+import atexit
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-def send_email_notification(to_email, subject, body_html):
-    """Envia uma notificação por e-mail."""
+# Conexões SMTP autenticadas reaproveitadas entre envios.
+SMTP_POOL_SIZE = 4
+SMTP_IDLE_TIMEOUT_SECONDS = 60
+SMTP_TIMEOUT_SECONDS = 30
+
+_smtp_idle = []  # [(conexão, instante do último uso)]
+_smtp_lock = threading.Lock()
+_smtp_slots = threading.BoundedSemaphore(SMTP_POOL_SIZE)
+
+def _open_smtp_connection(creds):
+    server = smtplib.SMTP(creds["smtp_server"], creds["smtp_port"], timeout=SMTP_TIMEOUT_SECONDS)
+    # smtp_starttls = false apenas para relays locais sem TLS (ex: o servidor de smtp_benchmark.py).
+    if creds.get("smtp_starttls", True):
+        server.starttls()
+    server.login(creds["sender_email"], creds["sender_password"])
+    return server
+
+def _close_smtp_connection(server):
     try:
-        creds = st.secrets["email_credentials"]
-        sender_email = creds["sender_email"]
-        password = creds["sender_password"]
-        
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body_html, 'html'))
-        
-        with smtplib.SMTP(creds["smtp_server"], creds["smtp_port"]) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.send_message(msg)
-        
-        return True
-    except Exception as e:
-        # Em produção, seria bom logar esse erro em vez de mostrá-lo na UI principal
-        print(f"Falha ao enviar e-mail de notificação: {e}")
-        return False
+        server.quit()
+    except Exception:
+        server.close()
+
+def _acquire_smtp_connection(creds):
+    with _smtp_lock:
+        while _smtp_idle:
+            server, last_used = _smtp_idle.pop()
+            if time.monotonic() - last_used < SMTP_IDLE_TIMEOUT_SECONDS:
+                return server
+            _close_smtp_connection(server)
+    return _open_smtp_connection(creds)
+
+def _release_smtp_connection(server):
+    with _smtp_lock:
+        _smtp_idle.append((server, time.monotonic()))
+
+def close_smtp_connections():
+    """Encerra todas as conexões SMTP ociosas do pool."""
+    with _smtp_lock:
+        while _smtp_idle:
+            _close_smtp_connection(_smtp_idle.pop()[0])
+
+atexit.register(close_smtp_connections)
+
+def _build_message(sender_email, to_email, subject, body_html):
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body_html, 'html'))
+    return msg
+
+def send_email(to_email, subject, body_html, creds=None):
+    """
+    Envia um e-mail sem interagir com a UI; propaga exceções ao chamador. Por padrão
+    usa as credenciais de st.secrets["email_credentials"].
+    """
+    creds = creds or st.secrets["email_credentials"]
+    msg = _build_message(creds["sender_email"], to_email, subject, body_html)
+    with _smtp_slots:
+        server = _acquire_smtp_connection(creds)
+        try:
+            try:
+                server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # A conexão ociosa foi encerrada pelo servidor: reabre uma única vez.
+                _close_smtp_connection(server)
+                server = _open_smtp_connection(creds)
+                server.send_message(msg)
+        except Exception:
+            _close_smtp_connection(server)
+            raise
+        _release_smtp_connection(server)
+
+def compose_digest(alerts):
+    """Agrupa vários alertas [{'subject', 'body_html'}] em um único (assunto, corpo)."""
+    if len(alerts) == 1:
+        return alerts[0]['subject'], alerts[0]['body_html']
+    subject = f"Resumo de {len(alerts)} alertas do Sistema de Checklist"
+    sections = [f"<h2>{alert['subject']}</h2>{alert['body_html']}" for alert in alerts]
+    return subject, "<hr>".join(sections)
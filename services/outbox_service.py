@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+
+# Fila local e durável de efeitos colaterais (e-mail, SMS e logs de auditoria).
+DB_PATH = os.environ.get("OUTBOX_PATH", os.path.join(os.getcwd(), "data", "outbox.sqlite3"))
+WORKER_COUNT = 2
+MAX_ATTEMPTS = 6
+RETRY_BACKOFF_SECONDS = 5
+POLL_INTERVAL_SECONDS = 5
+DONE_RETENTION_SECONDS = 7 * 24 * 3600
+# Tempo máximo de posse de uma tarefa em execução; depois disso outro processo pode retomá-la.
+LEASE_SECONDS = 10 * 60
+# Processos que apenas enfileiram tarefas (ex: maintenance_scheduler.py) desligam esta
+# opção; a entrega fica com os workers do app.
+AUTO_START_WORKER = True
+
+_local = threading.local()
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+def _get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT NOT NULL UNIQUE,"
+            " kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, last_error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # Tarefas com o mesmo group_key são processadas juntas (ex: resumo de e-mails).
+        # claimed_at/claimed_by registram a posse (lease) de uma tarefa em execução.
+        for column in ("group_key TEXT", "claimed_at REAL", "claimed_by INTEGER"):
+            try:
+                conn.execute(f"ALTER TABLE outbox ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_group ON outbox (group_key, status)")
+        _local.conn = conn
+    return conn
+
+# --- Tarefas ---
+# Cada tarefa recebe o payload e a chave de idempotência e deve lançar exceção em caso de falha.
+# Tarefas agrupadas recebem a lista de payloads do grupo.
+
+def _run_email(payload, idempotency_key):
+    from . import notification_service
+    notification_service.send_email(payload["to_email"], payload["subject"], payload["body_html"])
+
+def _run_email_digest(payloads, idempotency_key):
+    from . import notification_service
+    subject, body_html = notification_service.compose_digest(payloads)
+    notification_service.send_email(payloads[0]["to_email"], subject, body_html)
+
+def _run_unlock_sms(payload, idempotency_key):
+    from . import twilio_service, firestore_service
+    to_number = payload["to_number"]
+    sms_body = twilio_service.send_sms_command(to_number, payload["equipamento_serial"])
+    try:
+        firestore_service.log_action(payload["logger_email"], "SMS_DESBLOQUEIO_AUTO", f"Comando '{sms_body}' enviado para {to_number}.", log_id=f"{idempotency_key}-log", buffered=False)
+    except Exception as e:
+        # O SMS já foi entregue; uma nova tentativa reenviaria o comando.
+        print(f"Falha ao registrar log do SMS {idempotency_key}: {e}")
+
+def _unlock_sms_failed(payload, idempotency_key, error):
+    # Registrado uma única vez, quando a tarefa esgota as tentativas (não a cada falha).
+    from . import firestore_service
+    firestore_service.log_action(
+        payload["logger_email"], "ERRO_SMS", f"Falha ao enviar comando para {payload['to_number']} após {MAX_ATTEMPTS} tentativas: {error}",
+        log_id=f"{idempotency_key}-err"
+    )
+
+def _run_log(payload, idempotency_key):
+    from . import firestore_service
+    firestore_service.log_action(
+        payload["user"], payload["action"], payload["details"],
+        timestamp=datetime.fromisoformat(payload["timestamp"]), log_id=idempotency_key, buffered=False
+    )
+
+_TASKS = {"email": _run_email, "email_digest": _run_email_digest, "unlock_sms": _run_unlock_sms, "log": _run_log}
+_GROUPED_KINDS = {"email_digest"}
+# Chamados quando uma tarefa passa para 'failed' (payload, chave de idempotência, erro).
+_FAILURE_HANDLERS = {"unlock_sms": _unlock_sms_failed}
+
+# --- Enfileiramento ---
+
+def enqueue(kind, payload, idempotency_key=None, group_key=None, delay_seconds=0):
+    """
+    Grava uma tarefa na fila e acorda os workers. Tarefas com a mesma chave de
+    idempotência são enfileiradas uma única vez. Tarefas com o mesmo `group_key`
+    ainda pendentes compartilham o horário de execução da primeira do grupo.
+    Retorna True se a tarefa foi criada.
+    """
+    if kind not in _TASKS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    now = time.time()
+    conn = _get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        next_attempt_at = now + delay_seconds
+        if group_key:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE group_key = ? AND status = 'pending'", (group_key,)
+            ).fetchone()
+            if row and row[0] is not None:
+                next_attempt_at = row[0]
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, kind, payload, group_key, next_attempt_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (idempotency_key or uuid4().hex, kind, json.dumps(payload, ensure_ascii=False, default=str), group_key, next_attempt_at, now, now)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if AUTO_START_WORKER:
+        start_worker()
+        _wakeup.set()
+    return cursor.rowcount == 1
+
+def enqueue_email(to_email, subject, body_html, idempotency_key=None):
+    return enqueue("email", {"to_email": to_email, "subject": subject, "body_html": body_html}, idempotency_key)
+
+def enqueue_digest_email(to_email, subject, body_html, window_seconds, idempotency_key=None):
+    """Acumula o alerta e envia, ao fim da janela, um único e-mail com todos os alertas do destinatário."""
+    payload = {"to_email": to_email, "subject": subject, "body_html": body_html}
+    return enqueue("email_digest", payload, idempotency_key, group_key=f"digest:{to_email}", delay_seconds=window_seconds)
+
+def enqueue_unlock_sms(to_number, equipamento_serial, logger_email, idempotency_key=None):
+    return enqueue("unlock_sms", {"to_number": to_number, "equipamento_serial": equipamento_serial, "logger_email": logger_email}, idempotency_key)
+
+def enqueue_log(user_email, action, details, idempotency_key=None):
+    payload = {"user": user_email, "action": action, "details": details, "timestamp": datetime.now().isoformat()}
+    return enqueue("log", payload, idempotency_key)
+
+# --- Processamento ---
+
+def _claim_next_job():
+    conn = _get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        row = conn.execute(
+            "SELECT id, idempotency_key, kind, payload, attempts, group_key FROM outbox"
+            " WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT 1", (now,)
+        ).fetchone()
+        if not row:
+            conn.execute("COMMIT")
+            return None
+        job_id, idempotency_key, kind, payload, attempts, group_key = row
+        jobs = [(job_id, payload, attempts)]
+        if group_key:
+            jobs = conn.execute(
+                "SELECT id, payload, attempts FROM outbox WHERE group_key = ? AND status = 'pending' ORDER BY id", (group_key,)
+            ).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET status = 'processing', claimed_at = ?, claimed_by = ?, updated_at = ? WHERE id = ?",
+            [(now, os.getpid(), now, job[0]) for job in jobs]
+        )
+        conn.execute("COMMIT")
+        return idempotency_key, kind, jobs
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _reclaim_expired_jobs(conn):
+    """
+    Devolve à fila as tarefas em execução cujo lease expirou (o processo dono
+    terminou ou travou). Tarefas dentro do lease continuam com o processo dono.
+    """
+    now = time.time()
+    cursor = conn.execute(
+        "UPDATE outbox SET status = 'pending', claimed_at = NULL, claimed_by = NULL, updated_at = ?"
+        " WHERE status = 'processing' AND (claimed_at IS NULL OR claimed_at < ?)", (now, now - LEASE_SECONDS)
+    )
+    return cursor.rowcount
+
+def _finish_job(job_id, attempts, error=None):
+    now = time.time()
+    conn = _get_connection()
+    if error is None:
+        conn.execute(
+            "UPDATE outbox SET status = 'done', attempts = ?, last_error = NULL, claimed_at = NULL, claimed_by = NULL, updated_at = ? WHERE id = ?",
+            (attempts, now, job_id)
+        )
+    elif attempts >= MAX_ATTEMPTS:
+        conn.execute(
+            "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ?, claimed_at = NULL, claimed_by = NULL, updated_at = ? WHERE id = ?",
+            (attempts, str(error), now, job_id)
+        )
+    else:
+        next_attempt_at = now + RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+        conn.execute(
+            "UPDATE outbox SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?,"
+            " claimed_at = NULL, claimed_by = NULL, updated_at = ? WHERE id = ?",
+            (attempts, str(error), next_attempt_at, now, job_id)
+        )
+
+def process_next_job():
+    """Executa a próxima tarefa vencida da fila. Retorna False se não havia tarefa."""
+    claimed = _claim_next_job()
+    if not claimed:
+        return False
+    idempotency_key, kind, jobs = claimed
+    payloads = [json.loads(payload) for _, payload, _ in jobs]
+    error = None
+    try:
+        _TASKS[kind](payloads if kind in _GROUPED_KINDS else payloads[0], idempotency_key)
+    except Exception as e:
+        print(f"Falha ao processar tarefa {kind} ({idempotency_key}): {e}")
+        error = e
+    for job_id, _, attempts in jobs:
+        _finish_job(job_id, attempts + 1, error)
+    failure_handler = _FAILURE_HANDLERS.get(kind)
+    if error is not None and failure_handler and any(attempts + 1 >= MAX_ATTEMPTS for _, _, attempts in jobs):
+        try:
+            failure_handler(payloads[0], idempotency_key, error)
+        except Exception as e:
+            print(f"Falha ao registrar erro definitivo da tarefa {kind} ({idempotency_key}): {e}")
+    return True
+
+def _worker_loop():
+    last_reclaim = 0
+    while True:
+        try:
+            if time.monotonic() - last_reclaim > LEASE_SECONDS / 2:
+                last_reclaim = time.monotonic()
+                _reclaim_expired_jobs(_get_connection())
+            if process_next_job():
+                continue
+        except sqlite3.Error as e:
+            print(f"Erro ao acessar a fila de saída: {e}")
+        _wakeup.wait(POLL_INTERVAL_SECONDS)
+        _wakeup.clear()
+
+def start_worker():
+    """Inicia os workers do processo (uma única vez), retomando tarefas interrompidas."""
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        conn = _get_connection()
+        # Tarefas com lease vencido (processo anterior encerrado) voltam para a fila; as que
+        # ainda estão com outro processo ativo continuam com ele.
+        _reclaim_expired_jobs(conn)
+        conn.execute("DELETE FROM outbox WHERE status = 'done' AND updated_at < ?", (time.time() - DONE_RETENTION_SECONDS,))
+        for i in range(WORKER_COUNT):
+            worker = threading.Thread(target=_worker_loop, name=f"outbox-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import bcrypt
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# Custo (log2 das rodadas) usado em novos hashes. Hashes com custo diferente são
+# refeitos no próximo login bem-sucedido (migração gradual do fator de custo).
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Processos dedicados ao bcrypt, para não ocupar as threads que atendem as sessões.
+HASH_POOL_WORKERS = int(os.environ.get("BCRYPT_POOL_WORKERS", str(max(1, min(4, os.cpu_count() or 1)))))
+# Verificações aguardando um processo livre; acima disso o login é recusado na hora como "ocupado".
+HASH_QUEUE_LIMIT = HASH_POOL_WORKERS * 8
+# Tempo máximo de espera pelo resultado; acima disso a chamada também é tratada como "ocupado".
+HASH_TIMEOUT_SECONDS = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+class HasherBusy(Exception):
+    """A fila de verificações de senha está cheia."""
+
+def _checkpw(password, stored_hash):
+    return bcrypt.checkpw(password, stored_hash)
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" evita copiar para os filhos as threads do gRPC/Firestore do processo principal.
+            _pool = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _reset_pool(expected=None):
+    """Descarta o pool atual; com `expected`, apenas se ele ainda for o pool atual."""
+    global _pool
+    with _pool_lock:
+        if expected is not None and _pool is not expected:
+            return
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _submit(fn, *args):
+    """Envia a chamada ao pool, retornando (pool, future)."""
+    pool = _get_pool()
+    try:
+        return pool, pool.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        # Um processo do pool morreu, ou outra thread acabou de encerrar o pool
+        # ("cannot schedule new futures after shutdown"): recria-o e reenvia uma única vez.
+        _reset_pool(pool)
+        pool = _get_pool()
+        return pool, pool.submit(fn, *args)
+
+def _run(fn, *args):
+    # A thread da sessão nunca espera por vaga na fila nem executa o bcrypt por conta própria.
+    if not _slots.acquire(blocking=False):
+        raise HasherBusy()
+    try:
+        pool, future = _submit(fn, *args)
+        try:
+            return future.result(timeout=HASH_TIMEOUT_SECONDS)
+        except (BrokenProcessPool, CancelledError):
+            # O pool quebrou (ou foi encerrado por outra thread) com a chamada na fila.
+            _reset_pool(pool)
+            return _submit(fn, *args)[1].result(timeout=HASH_TIMEOUT_SECONDS)
+    except (FutureTimeoutError, BrokenProcessPool, CancelledError, RuntimeError) as e:
+        raise HasherBusy() from e
+    finally:
+        _slots.release()
+
+def check_password(password, stored_hash):
+    """Confere a senha contra o hash bcrypt em um processo do pool."""
+    if not stored_hash:
+        return False
+    try:
+        return _run(_checkpw, password.encode('utf-8'), stored_hash.encode('utf-8'))
+    except ValueError:
+        # Hash armazenado em formato inválido.
+        return False
+
+def hash_password(password, rounds=None):
+    """Gera o hash bcrypt da senha (com BCRYPT_ROUNDS por padrão) em um processo do pool."""
+    return _run(_hashpw, password.encode('utf-8'), rounds or BCRYPT_ROUNDS).decode('utf-8')
+
+def hash_rounds(stored_hash):
+    """Custo de um hash bcrypt ('$2b$12$...' -> 12), ou None se o formato for desconhecido."""
+    try:
+        return int(stored_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def needs_rehash(stored_hash, rounds=None):
+    return hash_rounds(stored_hash) != (rounds or BCRYPT_ROUNDS)
+
+def shutdown():
+    _reset_pool()
+
+atexit.register(shutdown)
+
+def benchmark(rounds=None, duration_seconds=10, workers=None):
+    """
+    Mede quantas verificações de senha (logins) por segundo o pool sustenta com o
+    custo informado. Retorna {'rounds', 'workers', 'logins', 'seconds',
+    'logins_per_second', 'logins_per_second_per_core'}.
+    """
+    rounds = rounds or BCRYPT_ROUNDS
+    workers = workers or HASH_POOL_WORKERS
+    password = b"benchmark-password"
+    stored_hash = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Aquece os processos antes de medir.
+        list(pool.map(_checkpw, [password] * workers, [stored_hash] * workers))
+        started, logins = time.monotonic(), 0
+        while time.monotonic() - started < duration_seconds:
+            logins += sum(pool.map(_checkpw, [password] * workers * 2, [stored_hash] * workers * 2))
+        elapsed = time.monotonic() - started
+    return {
+        "rounds": rounds, "workers": workers, "logins": logins, "seconds": round(elapsed, 2),
+        "logins_per_second": round(logins / elapsed, 2),
+        "logins_per_second_per_core": round(logins / elapsed / workers, 2),
+    }
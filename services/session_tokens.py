@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+import streamlit as st
+from .firebase_config import db
+
+# Validade (em segundos) de um token de sessão.
+SESSION_TTL_SECONDS = 12 * 3600
+
+# Revogações explícitas: tokens de um uid emitidos antes de `revoked_at` deixam de valer.
+# O listener mantém esta tabela em memória, então a verificação não lê o Firestore.
+_revoked_before = {}  # uid -> instante (epoch) da última revogação
+_lock = threading.Lock()
+_listener = None
+_fallback_key = None
+
+def _secret_key():
+    global _fallback_key
+    try:
+        return st.secrets["session"]["secret_key"].encode('utf-8')
+    except (KeyError, FileNotFoundError, AttributeError):
+        with _lock:
+            if _fallback_key is None:
+                # Sem chave configurada, os tokens valem apenas enquanto este processo estiver ativo.
+                print("Aviso: [session] secret_key não configurada; usando chave temporária do processo.")
+                _fallback_key = secrets.token_bytes(32)
+            return _fallback_key
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload_b64):
+    return _b64encode(hmac.new(_secret_key(), payload_b64.encode('ascii'), hashlib.sha256).digest())
+
+def issue(uid, claims, totp_enabled=False, ttl_seconds=SESSION_TTL_SECONDS):
+    """
+    Emite um token de sessão assinado (HMAC-SHA256) com o uid, as custom claims
+    do usuário (role e gestor_uid) e o status do 2FA.
+    """
+    now = time.time()
+    payload = {
+        "uid": uid, "role": claims.get('role'), "gestor_uid": claims.get('gestor_uid'),
+        "totp": bool(totp_enabled), "iat": round(now, 3), "exp": int(now + ttl_seconds),
+    }
+    payload_b64 = _b64encode(json.dumps(payload, separators=(",", ":")).encode('utf-8'))
+    return f"{payload_b64}.{_sign(payload_b64)}"
+
+def verify(token):
+    """Retorna as claims do token se a assinatura, a validade e a revogação estiverem ok; senão None."""
+    start_listener()
+    try:
+        payload_b64, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload_b64)):
+            return None
+        claims = json.loads(_b64decode(payload_b64))
+    except (AttributeError, ValueError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    with _lock:
+        revoked_at = _revoked_before.get(claims.get("uid"))
+    if revoked_at is not None and claims.get("iat", 0) <= revoked_at:
+        return None
+    return claims
+
+def revoke(uid):
+    """Invalida todos os tokens já emitidos para o uid, neste e nos demais processos."""
+    revoked_at = time.time()
+    with _lock:
+        _revoked_before[uid] = revoked_at
+    try:
+        db.collection("session_revocations").document(uid).set({"revoked_at": revoked_at})
+    except Exception as e:
+        print(f"Erro ao registrar revogação de sessão de {uid}: {e}")
+
+def _on_revocations_snapshot(doc_snapshots, changes, read_time):
+    with _lock:
+        for change in changes:
+            if change.type.name == "REMOVED":
+                continue
+            revoked_at = (change.document.to_dict() or {}).get("revoked_at")
+            if revoked_at is not None:
+                _revoked_before[change.document.id] = max(revoked_at, _revoked_before.get(change.document.id, 0))
+
+def start_listener():
+    """Inicia (uma única vez por processo) o listener das revogações de sessão."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        _listener = False
+    try:
+        listener = db.collection("session_revocations").on_snapshot(_on_revocations_snapshot)
+        with _lock:
+            _listener = listener
+    except Exception as e:
+        print(f"Erro ao iniciar o listener de revogações de sessão: {e}")
@@ -1,12 +1,38 @@
 # -*- coding: utf-8 -*-
+import time
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from firebase_admin import storage
 from uuid import uuid4
 
+# Configurações do envio paralelo de fotos.
+UPLOAD_MAX_WORKERS = 4
+UPLOAD_RETRIES = 2
+UPLOAD_RETRY_BACKOFF_SECONDS = 1.0
+
+def _upload_blob(file, destination_path):
+    """Envia o arquivo já com leitura pública e retorna a URL; propaga exceções."""
+    bucket = storage.bucket()
+    blob = bucket.blob(destination_path)
+    # O st.camera_input retorna um objeto BytesIO, então usamos upload_from_file.
+    # A ACL pública é aplicada no próprio upload, evitando a chamada extra ao make_public.
+    file.seek(0)
+    blob.upload_from_file(file, content_type='image/jpeg', predefined_acl='publicRead')
+    return blob.public_url
+
+def _upload_with_retry(file, destination_path, retries):
+    for attempt in range(retries + 1):
+        try:
+            return _upload_blob(file, destination_path), None
+        except Exception as e:
+            if attempt == retries:
+                return None, e
+            time.sleep(UPLOAD_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
 def upload_file(file, destination_path):
     """
     Faz upload de um objeto de arquivo para o Firebase Storage.
-    
+
     Args:
         file: O objeto de arquivo (do st.camera_input).
         destination_path: O caminho no Storage onde o arquivo será salvo.
@@ -17,17 +43,34 @@ def upload_file(file, destination_path):
     if file is None:
         return None
     try:
-        bucket = storage.bucket()
-        blob = bucket.blob(destination_path)
-        
-        # O st.camera_input retorna um objeto BytesIO, então usamos upload_from_file
-        file.seek(0)
-        blob.upload_from_file(file, content_type='image/jpeg')
-        
-        # Torna o arquivo publicamente acessível
-        blob.make_public()
-        
-        return blob.public_url
+        return _upload_blob(file, destination_path)
     except Exception as e:
         st.error(f"Erro no upload do arquivo: {e}")
         return None
+
+def upload_files(files_by_path, max_workers=UPLOAD_MAX_WORKERS, retries=UPLOAD_RETRIES):
+    """
+    Faz upload de vários arquivos em paralelo, com novas tentativas por arquivo.
+
+    Args:
+        files_by_path: Dict {caminho no Storage: objeto de arquivo}.
+        max_workers: Quantidade máxima de uploads simultâneos.
+        retries: Novas tentativas por arquivo após a primeira falha.
+
+    Returns:
+        Uma tupla (urls, erros): {caminho: URL pública} dos envios concluídos e
+        {caminho: exceção} dos que falharam após todas as tentativas.
+    """
+    files_by_path = {path: file for path, file in files_by_path.items() if file is not None}
+    urls, errors = {}, {}
+    if not files_by_path:
+        return urls, errors
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files_by_path))) as executor:
+        futures = {path: executor.submit(_upload_with_retry, file, path, retries) for path, file in files_by_path.items()}
+        for path, future in futures.items():
+            url, error = future.result()
+            if url:
+                urls[path] = url
+            else:
+                errors[path] = error
+    return urls, errors
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from . import etrac_service, trip_store
+
+DEFAULT_CONCURRENCY = 8
+
+def date_range(start_date, end_date):
+    """Lista os dias entre start_date e end_date (inclusive)."""
+    days = []
+    current = start_date
+    while current <= end_date:
+        days.append(current)
+        current += timedelta(days=1)
+    return days
+
+async def iter_trip_summaries(email, api_key, plates, dates, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Busca o resumo de viagens para todos os pares (placa, data), com no máximo
+    `concurrency` requisições simultâneas, entregando cada resultado assim que
+    ele chega como (placa, data, viagens, erro). Dias já encerrados são lidos
+    do armazenamento local do gestor e gravados nele após a primeira busca bem-sucedida.
+    """
+    pairs = [(plate, day) for plate in plates for day in dates]
+    stored = trip_store.get_many(email, [(plate, day) for plate, day in pairs if trip_store.is_immutable(day)])
+    for (plate, day), trips in stored.items():
+        yield plate, day, trips, None
+
+    missing = [pair for pair in pairs if pair not in stored]
+    if not missing:
+        return
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        async def fetch(plate, day):
+            async with semaphore:
+                try:
+                    trips = await loop.run_in_executor(executor, etrac_service.fetch_trip_summary, email, api_key, plate, day)
+                except Exception as e:
+                    return plate, day, None, e
+            if trip_store.is_immutable(day):
+                await loop.run_in_executor(executor, trip_store.put, email, plate, day, trips)
+            return plate, day, trips, None
+
+        tasks = [asyncio.create_task(fetch(plate, day)) for plate, day in missing]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+def fetch_trip_summaries(email, api_key, plates, dates, concurrency=DEFAULT_CONCURRENCY, on_result=None):
+    """
+    Versão síncrona de `iter_trip_summaries` para uso nas páginas Streamlit.
+    Retorna ({(placa, data): viagens}, {(placa, data): erro}); `on_result`,
+    se informado, é chamado a cada resultado recebido.
+    """
+    async def collect():
+        results, errors = {}, {}
+        async for plate, day, trips, error in iter_trip_summaries(email, api_key, plates, dates, concurrency):
+            if error is not None:
+                errors[(plate, day)] = error
+            else:
+                results[(plate, day)] = trips
+            if on_result:
+                on_result(plate, day, trips, error)
+        return results, errors
+    return asyncio.run(collect())
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date as date_type, datetime
+
+# Caminho do banco local com os resumos de viagens de dias já encerrados. Cada resumo
+# pertence às credenciais (e-mail do gestor) que o buscaram.
+DB_PATH = os.environ.get("TRIP_STORE_PATH", os.path.join(os.getcwd(), "data", "trip_summaries.sqlite3"))
+
+_local = threading.local()
+
+def _get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # A tabela antiga, chaveada só por (placa, dia), podia guardar respostas de erro.
+        conn.execute("DROP TABLE IF EXISTS trip_summaries")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS gestor_trip_summaries ("
+            " owner TEXT NOT NULL, plate TEXT NOT NULL, day INTEGER NOT NULL, trips BLOB NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (owner, plate, day)) WITHOUT ROWID"
+        )
+        _local.conn = conn
+    return conn
+
+def _as_date(day):
+    return day.date() if isinstance(day, datetime) else day
+
+def _day_key(day):
+    """Converte a data em um inteiro AAAAMMDD, mais compacto que texto."""
+    day = _as_date(day)
+    return day.year * 10000 + day.month * 100 + day.day
+
+def _encode(trips):
+    return zlib.compress(json.dumps(trips, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+
+def _decode(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def is_immutable(day):
+    """Somente dias anteriores a hoje têm resumo definitivo."""
+    return _as_date(day) < date_type.today()
+
+def get(owner, plate, day):
+    """Retorna as viagens armazenadas para (gestor, placa, dia) ou None se não houver registro."""
+    try:
+        row = _get_connection().execute(
+            "SELECT trips FROM gestor_trip_summaries WHERE owner = ? AND plate = ? AND day = ?", (owner, plate, _day_key(day))
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Erro ao ler resumo de viagens local: {e}")
+        return None
+    return _decode(row[0]) if row else None
+
+def get_many(owner, pairs):
+    """Retorna um dict {(placa, dia): viagens} apenas com os pares já armazenados para o gestor."""
+    found = {}
+    try:
+        conn = _get_connection()
+        for plate, day in pairs:
+            row = conn.execute(
+                "SELECT trips FROM gestor_trip_summaries WHERE owner = ? AND plate = ? AND day = ?", (owner, plate, _day_key(day))
+            ).fetchone()
+            if row:
+                found[(plate, day)] = _decode(row[0])
+    except sqlite3.Error as e:
+        print(f"Erro ao ler resumos de viagens locais: {e}")
+    return found
+
+def put(owner, plate, day, trips):
+    """
+    Grava o resumo de um dia encerrado para o gestor. Dias em aberto e resultados
+    que não sejam uma lista de viagens (ex: falha da API) são ignorados.
+    """
+    if not owner or not is_immutable(day) or not isinstance(trips, list):
+        return False
+    try:
+        conn = _get_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO gestor_trip_summaries (owner, plate, day, trips, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (owner, plate, _day_key(day), _encode(trips), time.time())
+            )
+        return True
+    except sqlite3.Error as e:
+        print(f"Erro ao gravar resumo de viagens local: {e}")
+        return False
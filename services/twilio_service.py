@@ -1,24 +1,91 @@
 # -*- coding: utf-8 -*-
+import threading
+import time
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from twilio.rest import Client
-from . import firestore_service # Importamos para logar a ação
-
-def send_unlock_sms(to_number, equipamento_serial, admin_email_logger):
-    """Envia o comando de desbloqueio via SMS usando Twilio."""
-    try:
-        creds = st.secrets["twilio_credentials"]
-        command_template = st.secrets["sms_config"]["command_template"]
-        
-        # Formata o comando com o serial do equipamento
-        sms_body = command_template.format(equipamento_serial=equipamento_serial)
-        
-        client = Client(creds["account_sid"], creds["auth_token"])
-        message = client.messages.create(body=sms_body, from_=creds["from_number"], to=to_number)
-        
-        st.success(f"Comando de desbloqueio enviado para o número {to_number}.")
-        firestore_service.log_action(admin_email_logger, "SMS_DESBLOQUEIO_AUTO", f"Comando '{sms_body}' enviado para {to_number}.")
-        return True
-    except Exception as e:
-        st.error(f"Falha ao enviar SMS: {e}")
-        firestore_service.log_action(admin_email_logger, "ERRO_SMS", f"Falha ao enviar comando para {to_number}: {e}")
-        return False
+from . import outbox_service # Logs de auditoria são gravados em segundo plano
+
+# Limites do envio em massa de comandos.
+BULK_MAX_WORKERS = 8
+BULK_MESSAGES_PER_SECOND = 5
+
+@st.cache_resource
+def _get_client(account_sid, auth_token, api_base_url=None):
+    """Cliente Twilio compartilhado pelo processo (reaproveita a sessão HTTP)."""
+    client = Client(account_sid, auth_token)
+    if api_base_url:
+        # Permite apontar para um endpoint local/falso em testes.
+        client.api.base_url = api_base_url
+    return client
+
+@st.cache_resource
+def _get_sms_settings():
+    creds = dict(st.secrets["twilio_credentials"])
+    command_template = st.secrets["sms_config"]["command_template"]
+    return creds, command_template
+
+def _create_message(to_number, equipamento_serial):
+    creds, command_template = _get_sms_settings()
+    # Formata o comando com o serial do equipamento
+    sms_body = command_template.format(equipamento_serial=equipamento_serial)
+    client = _get_client(creds["account_sid"], creds["auth_token"], creds.get("api_base_url"))
+    message = client.messages.create(body=sms_body, from_=creds["from_number"], to=to_number)
+    return sms_body, message
+
+def send_sms_command(to_number, equipamento_serial):
+    """Envia o comando de desbloqueio sem interagir com a UI; retorna o texto enviado e propaga exceções."""
+    sms_body, _ = _create_message(to_number, equipamento_serial)
+    return sms_body
+
+class _RateLimiter:
+    """Espaça as chamadas para no máximo `rate` por segundo entre todas as threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def send_unlock_commands(targets, admin_email_logger=None, max_workers=BULK_MAX_WORKERS, messages_per_second=BULK_MESSAGES_PER_SECOND):
+    """
+    Envia o comando de desbloqueio para vários pares (sim_number, equipamento_serial)
+    em paralelo, respeitando o limite de mensagens por segundo.
+
+    Returns:
+        Um resumo {'total', 'sent', 'failed', 'elapsed_seconds', 'results'}, onde
+        cada resultado traz to_number, equipamento_serial, status ('enviado'/'falha'),
+        sid e error.
+    """
+    limiter = _RateLimiter(messages_per_second)
+
+    def dispatch(target):
+        to_number, equipamento_serial = target
+        limiter.wait()
+        try:
+            _, message = _create_message(to_number, equipamento_serial)
+            return {"to_number": to_number, "equipamento_serial": equipamento_serial, "status": "enviado", "sid": getattr(message, "sid", None), "error": None}
+        except Exception as e:
+            return {"to_number": to_number, "equipamento_serial": equipamento_serial, "status": "falha", "sid": None, "error": str(e)}
+
+    started = time.monotonic()
+    targets = list(targets)
+    results = []
+    if targets:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(targets))) as executor:
+            results = list(executor.map(dispatch, targets))
+    sent = sum(1 for result in results if result["status"] == "enviado")
+    summary = {
+        "total": len(results), "sent": sent, "failed": len(results) - sent,
+        "elapsed_seconds": round(time.monotonic() - started, 2), "results": results
+    }
+    if admin_email_logger and results:
+        outbox_service.enqueue_log(admin_email_logger, "SMS_DESBLOQUEIO_LOTE", f"{sent} de {len(results)} comandos enviados; {len(results) - sent} falhas.")
+    return summary
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Mede a vazão de envio de e-mails (mensagens por segundo) do notification_service
+contra um servidor SMTP local de teste, com e sem reaproveitamento de conexões.
+
+Uso:
+    python smtp_benchmark.py                          # 200 mensagens, 20 ms de latência
+    python smtp_benchmark.py --messages 500 --latency 50
+    python smtp_benchmark.py --threads 8
+"""
+import sys
+import os
+import argparse
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.getcwd())
+
+from services import notification_service
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo: aceita EHLO, AUTH, MAIL, RCPT e DATA e descarta as mensagens."""
+
+    def _reply(self, *lines):
+        # Simula a latência de ida e volta até o relay.
+        time.sleep(self.server.latency_seconds)
+        self.wfile.write("".join(f"{line}\r\n" for line in lines).encode('ascii'))
+
+    def handle(self):
+        self._reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250-stub", "250-AUTH PLAIN LOGIN", "250 OK")
+            elif command.startswith("AUTH"):
+                self._reply("235 2.7.0 Authentication successful")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency_seconds):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.latency_seconds = latency_seconds
+        self.messages = 0
+        self.lock = threading.Lock()
+
+def run(creds, messages, threads, reuse_connections):
+    notification_service.close_smtp_connections()
+
+    def send(i):
+        notification_service.send_email("destino@example.com", f"Alerta {i}", "<p>Checklist com inconformidades.</p>", creds=creds)
+        if not reuse_connections:
+            # Sem pool: cada mensagem paga conexão, EHLO e login.
+            notification_service.close_smtp_connections()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, range(messages)))
+    elapsed = time.monotonic() - started
+    notification_service.close_smtp_connections()
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de mensagens por segundo do envio de e-mails.")
+    parser.add_argument("--messages", type=int, default=200, help="Mensagens enviadas em cada medição.")
+    parser.add_argument("--threads", type=int, default=notification_service.SMTP_POOL_SIZE, help="Envios simultâneos.")
+    parser.add_argument("--latency", type=float, default=20, help="Latência simulada por resposta do servidor, em ms.")
+    args = parser.parse_args()
+
+    server = StubSMTPServer(args.latency / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    creds = {
+        "smtp_server": "127.0.0.1", "smtp_port": server.server_address[1], "smtp_starttls": False,
+        "sender_email": "checklist@example.com", "sender_password": "stub",
+    }
+
+    print(f"{'modo':>16} {'mensagens':>9} {'segundos':>9} {'msgs/s':>8}")
+    for label, reuse in (("nova conexão", False), ("pool de conexões", True)):
+        elapsed = run(creds, args.messages, args.threads, reuse)
+        print(f"{label:>16} {args.messages:>9} {elapsed:>9.2f} {args.messages / elapsed:>8.1f}")
+    server.shutdown()
+    print(f"{server.messages} mensagem(ns) recebida(s) pelo servidor de teste.")
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+# Campos dos checklists usados pelas tendências (use como projeção na consulta). Os
+# itens, a parte mais pesada do documento, ficam de fora: as contagens por item vêm
+# dos agregados de BI.
+TREND_FIELDS = ["timestamp", "vehicle_plate", "driver_email", "status", "approval_timestamp"]
+
+FAIL_STATUS = "Não OK"
+
+def build_frames(checklists):
+    """
+    Converte uma sequência de checklists (dicts do Firestore) em dois DataFrames
+    indexados por timestamp (UTC, ordem crescente):
+
+    - checklists: uma linha por checklist, com placa, motorista e status categóricos,
+      `is_nonconforming`, `failed_items`, `total_items` e `approval_hours`;
+    - items: uma linha por item verificado, com `item`, `item_status` e `is_fail`.
+
+    A conversão percorre os dados uma única vez; todas as métricas abaixo operam
+    de forma vetorizada sobre esses frames.
+    """
+    keys, doc_ids, timestamps, plates, drivers, statuses, locations, approvals = [], [], [], [], [], [], [], []
+    item_keys, item_names, item_statuses = [], [], []
+    for key, checklist in enumerate(checklists):
+        keys.append(key)
+        doc_ids.append(checklist.get('doc_id'))
+        timestamps.append(checklist.get('timestamp'))
+        plates.append(checklist.get('vehicle_plate'))
+        drivers.append(checklist.get('driver_email'))
+        statuses.append(checklist.get('status'))
+        locations.append(checklist.get('location_status'))
+        approvals.append(checklist.get('approval_timestamp'))
+        for item, item_data in (checklist.get('items') or {}).items():
+            item_keys.append(key)
+            item_names.append(item)
+            item_statuses.append(item_data.get('status') if isinstance(item_data, dict) else item_data)
+
+    plates_cat = pd.Categorical(plates)
+    drivers_cat = pd.Categorical(drivers)
+    timestamp_index = pd.DatetimeIndex(pd.to_datetime(pd.Series(timestamps, dtype="object"), utc=True), name="timestamp")
+    status_values = pd.Series(statuses, dtype="object").fillna("")
+    checklists_df = pd.DataFrame({
+        "checklist_key": np.asarray(keys, dtype=np.int64),
+        "doc_id": doc_ids,
+        "vehicle_plate": plates_cat,
+        "driver_email": drivers_cat,
+        "status": pd.Categorical(statuses),
+        "location_status": pd.Categorical(locations),
+        "approval_timestamp": pd.to_datetime(pd.Series(approvals, dtype="object"), utc=True).array,
+        "is_nonconforming": ((status_values != "") & ~status_values.str.contains("Aprovado", regex=False)).to_numpy(),
+    }, index=timestamp_index)
+
+    item_key_array = np.asarray(item_keys, dtype=np.int64)
+    items_df = pd.DataFrame({
+        "checklist_key": item_key_array,
+        "vehicle_plate": plates_cat.take(item_key_array),
+        "driver_email": drivers_cat.take(item_key_array),
+        "item": pd.Categorical(item_names),
+        "item_status": pd.Categorical(item_statuses),
+        "is_fail": (pd.Series(item_statuses, dtype="object") == FAIL_STATUS).to_numpy(),
+    }, index=timestamp_index.take(item_key_array))
+
+    failed_per_checklist = np.bincount(item_key_array, weights=items_df["is_fail"].to_numpy(), minlength=len(keys))
+    total_per_checklist = np.bincount(item_key_array, minlength=len(keys))
+    checklists_df["failed_items"] = failed_per_checklist.astype(np.int64)
+    checklists_df["total_items"] = total_per_checklist.astype(np.int64)
+    checklists_df["approval_hours"] = (checklists_df["approval_timestamp"] - checklists_df.index).dt.total_seconds().to_numpy() / 3600.0
+
+    return checklists_df.sort_index(), items_df.sort_index()
+
+def failure_rates(checklists_df, by):
+    """Quantidade de checklists, inconformidades e taxa de inconformidade por `by` (ex: 'vehicle_plate', 'driver_email')."""
+    grouped = checklists_df.groupby(by, observed=True)["is_nonconforming"]
+    result = pd.DataFrame({"checklists": grouped.size(), "nonconforming": grouped.sum(), "failure_rate": grouped.mean()})
+    return result.sort_values(["failure_rate", "nonconforming"], ascending=False)
+
+def failure_trend(checklists_df, by="vehicle_plate", freq="W"):
+    """Inconformidades por período (`freq`) e por `by`, em formato largo (uma coluna por valor de `by`)."""
+    nonconforming = checklists_df[checklists_df["is_nonconforming"]]
+    if nonconforming.empty:
+        return pd.DataFrame()
+    counts = nonconforming.groupby([pd.Grouper(freq=freq), by], observed=True).size()
+    return counts.unstack(by, fill_value=0)
+
+def rolling_failure_rate(checklists_df, window="7D"):
+    """Taxa diária de inconformidade suavizada por uma janela móvel de tempo."""
+    if checklists_df.empty:
+        return pd.Series(dtype="float64")
+    daily = checklists_df["is_nonconforming"].astype("int64").resample("D").agg(["sum", "count"])
+    rolled = daily.rolling(window).sum()
+    return (rolled["sum"] / rolled["count"].replace(0, np.nan)).rename("failure_rate")
+
+def time_to_approval(checklists_df, by=None):
+    """Estatísticas (em horas) do tempo entre o envio e a decisão do gestor, opcionalmente por `by`."""
+    decided = checklists_df.dropna(subset=["approval_hours"])
+    if by is None:
+        return decided["approval_hours"].agg(["count", "mean", "median", "max"])
+    return decided.groupby(by, observed=True)["approval_hours"].agg(["count", "mean", "median", "max"]).sort_values("mean", ascending=False)
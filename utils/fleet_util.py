@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+FLEET_COLUMNS = ["placa", "odometro_km", "bateria_v", "velocidade_kmh", "ignicao", "latitude", "longitude", "data_transmissao"]
+
+def _parse_decimal_br(series):
+    """Converte números no formato brasileiro ('12.345,6') em float; valores inválidos viram NaN."""
+    cleaned = series.astype("string").str.replace(".", "", regex=False).str.replace(",", ".", regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+def _parse_decimal(series):
+    """Converte números com vírgula ou ponto decimal ('12,5' ou '12.5') em float."""
+    cleaned = series.astype("string").str.replace(",", ".", regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+def build_fleet_frame(vehicles):
+    """
+    Normaliza as posições retornadas pela eTrac em uma tabela tipada, indexada
+    pela placa: odômetro (km), bateria (V), velocidade (km/h), ignição, coordenadas
+    e horário da última transmissão.
+    """
+    raw = pd.DataFrame.from_records(list(vehicles))
+    if raw.empty or "placa" not in raw:
+        return pd.DataFrame(columns=FLEET_COLUMNS).set_index("placa")
+    raw = raw.dropna(subset=["placa"]).drop_duplicates(subset=["placa"], keep="last")
+
+    def column(name):
+        return raw[name] if name in raw else pd.Series(np.nan, index=raw.index, dtype="object")
+
+    odometer = column("odometro").astype("string").str.replace("km", "", regex=False)
+    fleet = pd.DataFrame({
+        "placa": raw["placa"].astype("string"),
+        "odometro_km": _parse_decimal_br(odometer),
+        "bateria_v": _parse_decimal(column("bateria")),
+        "velocidade_kmh": _parse_decimal(column("velocidade")),
+        "ignicao": pd.to_numeric(column("ignicao"), errors="coerce").eq(1),
+        "latitude": _parse_decimal(column("latitude")),
+        "longitude": _parse_decimal(column("longitude")),
+        "data_transmissao": pd.to_datetime(column("data_transmissao"), dayfirst=True, errors="coerce"),
+    })
+    return fleet.set_index("placa")
+
+def build_schedule_frame(schedules):
+    """Converte {placa: plano} em uma tabela tipada indexada pela placa."""
+    frame = pd.DataFrame.from_dict(schedules, orient="index")
+    frame.index = frame.index.astype("string")
+    frame.index.name = "placa"
+    for column, default in (("last_maintenance_km", 0.0), ("threshold_km", 0.0), ("alert_range_km", 0.0), ("km_per_day", np.nan)):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").fillna(default) if column in frame else default
+    notified = pd.to_numeric(frame["notification_sent_for_km"], errors="coerce") if "notification_sent_for_km" in frame else pd.Series(np.nan, index=frame.index)
+    frame["notification_sent_for_km"] = notified.fillna(frame["last_maintenance_km"])
+    if "notes" not in frame:
+        frame["notes"] = None
+    frame["notes"] = frame["notes"].where(frame["notes"].notna() & (frame["notes"] != ""), "Manutenção Preventiva")
+    return frame
+
+def evaluate_schedules(fleet, schedules, today=None):
+    """
+    Avalia todos os planos contra a frota em uma única junção vetorizada.
+
+    Retorna, por placa com plano e odômetro válido: odômetro atual, km da próxima
+    manutenção, início da janela de alerta, km restantes, `is_due` (entrou na janela
+    e ainda não foi notificada) e, quando há `km_per_day`, a previsão de dias e a
+    data em que o limite será atingido.
+    """
+    if fleet.empty or schedules.empty:
+        return pd.DataFrame(columns=["odometro_km", "next_maintenance_km", "alert_starts_at_km", "km_remaining", "is_due", "days_to_due", "projected_due_date"])
+    joined = schedules.join(fleet[["odometro_km"]], how="inner")
+    joined = joined[joined["odometro_km"].notna()]
+    joined["next_maintenance_km"] = joined["last_maintenance_km"] + joined["threshold_km"]
+    joined["alert_starts_at_km"] = joined["next_maintenance_km"] - joined["alert_range_km"]
+    joined["km_remaining"] = joined["next_maintenance_km"] - joined["odometro_km"]
+    joined["is_due"] = (
+        (joined["threshold_km"] > 0)
+        & (joined["odometro_km"] >= joined["alert_starts_at_km"])
+        & (joined["notification_sent_for_km"] < joined["alert_starts_at_km"])
+    )
+    rate = joined["km_per_day"].where(joined["km_per_day"] > 0)
+    joined["days_to_due"] = np.ceil(joined["km_remaining"].clip(lower=0) / rate)
+    today = pd.Timestamp(today or pd.Timestamp.now().normalize())
+    joined["projected_due_date"] = today + pd.to_timedelta(joined["days_to_due"], unit="D")
+    return joined
+
+def update_km_per_day(schedules, fleet, now=None, min_interval_days=1.0, smoothing=0.3):
+    """
+    Calcula a média de km rodados por dia de cada veículo a partir da última
+    amostra de odômetro guardada no plano (`odometer_sample_km`/`odometer_sample_at`),
+    suavizada exponencialmente. Retorna {placa: campos a atualizar} apenas para os
+    planos cuja amostra tem pelo menos `min_interval_days`.
+    """
+    if fleet.empty or schedules.empty:
+        return {}
+    now = pd.Timestamp(now or pd.Timestamp.now())
+    joined = schedules.join(fleet[["odometro_km"]], how="inner")
+    joined = joined[joined["odometro_km"].notna()]
+    if "odometer_sample_km" not in joined:
+        joined["odometer_sample_km"] = np.nan
+    if "odometer_sample_at" not in joined:
+        joined["odometer_sample_at"] = pd.NaT
+    sample_at = pd.to_datetime(joined["odometer_sample_at"], errors="coerce", utc=True).dt.tz_localize(None)
+    sample_km = pd.to_numeric(joined["odometer_sample_km"], errors="coerce")
+    elapsed_days = (now - sample_at).dt.total_seconds() / 86400.0
+    needs_sample = sample_at.isna() | (elapsed_days >= min_interval_days)
+
+    observed = (joined["odometro_km"] - sample_km) / elapsed_days
+    observed = observed.where((observed >= 0) & np.isfinite(observed))
+    previous = joined["km_per_day"]
+    blended = np.where(previous.notna() & observed.notna(), smoothing * observed + (1 - smoothing) * previous, observed.fillna(previous))
+
+    updates = {}
+    for plate, odometer, km_per_day in zip(joined.index[needs_sample], joined["odometro_km"][needs_sample], pd.Series(blended, index=joined.index)[needs_sample]):
+        fields = {"odometer_sample_km": float(odometer), "odometer_sample_at": now.to_pydatetime()}
+        if not np.isnan(km_per_day):
+            fields["km_per_day"] = round(float(km_per_day), 1)
+        updates[str(plate)] = fields
+    return updates
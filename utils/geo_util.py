@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 from math import radians, cos, sin, asin, sqrt
 
+# Raio médio da Terra em metros.
+EARTH_RADIUS_M = 6371000
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calcula a distância em metros entre dois pontos de lat/lon.
@@ -13,6 +17,13 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     dlat = lat2 - lat1
     a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
     c = 2 * asin(sqrt(a))
-    # Raio da Terra em metros.
-    r = 6371000
-    return c * r
+    return c * EARTH_RADIUS_M
+
+def haversine_distances(lat1, lon1, lat2, lon2):
+    """
+    Versão vetorizada de `haversine_distance`: aceita arrays (com broadcasting do
+    NumPy) e retorna as distâncias em metros.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
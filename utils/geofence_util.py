@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from utils import geo_util
+
+# Tipos de cerca suportados. Círculos usam latitude/longitude/radius_meters;
+# polígonos usam points: [{'latitude', 'longitude'}, ...] (pelo menos 3 vértices).
+FENCE_TYPES = ("circle", "polygon")
+
+def compile_fences(fences):
+    """
+    Normaliza as cercas e pré-calcula o retângulo envolvente (bounding box) de
+    cada uma, usado como filtro espacial antes do teste exato. Cercas com dados
+    inválidos são ignoradas.
+    """
+    compiled = []
+    for fence in fences or []:
+        kind = fence.get("type", "circle")
+        try:
+            if kind == "polygon":
+                vertices = np.array([(float(p["latitude"]), float(p["longitude"])) for p in fence.get("points", [])], dtype=float)
+                if len(vertices) < 3 or not np.isfinite(vertices).all():
+                    continue
+                lats, lons = vertices[:, 0], vertices[:, 1]
+                compiled.append({
+                    "name": fence.get("name") or "", "type": "polygon", "lats": lats, "lons": lons,
+                    "bbox": (lats.min(), lats.max(), lons.min(), lons.max()),
+                })
+            else:
+                lat, lon, radius = float(fence["latitude"]), float(fence["longitude"]), float(fence["radius_meters"])
+                if not (np.isfinite([lat, lon, radius]).all() and radius > 0):
+                    continue
+                dlat = np.degrees(radius / geo_util.EARTH_RADIUS_M)
+                dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+                compiled.append({
+                    "name": fence.get("name") or "", "type": "circle", "latitude": lat, "longitude": lon, "radius_meters": radius,
+                    "bbox": (lat - dlat, lat + dlat, lon - dlon, lon + dlon),
+                })
+        except (KeyError, TypeError, ValueError):
+            continue
+    return compiled
+
+def points_in_polygon(lats, lons, poly_lats, poly_lons):
+    """Teste de ponto-em-polígono (ray casting) vetorizado sobre arrays de posições."""
+    y = np.asarray(lats, dtype=float)[:, None]
+    x = np.asarray(lons, dtype=float)[:, None]
+    y1, x1 = np.asarray(poly_lats, dtype=float), np.asarray(poly_lons, dtype=float)
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+
+def distances_to_polygon(lats, lons, poly_lats, poly_lons):
+    """
+    Distância em metros de cada ponto até a borda mais próxima do polígono, usando
+    uma projeção plana local (adequada para pátios de alguns quilômetros).
+    """
+    scale_y = np.radians(1.0) * geo_util.EARTH_RADIUS_M
+    scale_x = scale_y * np.cos(np.radians(np.mean(poly_lats)))
+    py = np.asarray(lats, dtype=float)[:, None] * scale_y
+    px = np.asarray(lons, dtype=float)[:, None] * scale_x
+    ay, ax = np.asarray(poly_lats, dtype=float) * scale_y, np.asarray(poly_lons, dtype=float) * scale_x
+    by, bx = np.roll(ay, -1), np.roll(ax, -1)
+    dy, dx = by - ay, bx - ax
+    length_sq = np.where(dx**2 + dy**2 > 0, dx**2 + dy**2, 1.0)
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy)).min(axis=1)
+
+def classify_points(lats, lons, fences):
+    """
+    Classifica um array de posições contra todas as cercas de uma vez.
+
+    Returns:
+        (fence_index, distance_m): índice da primeira cerca que contém o ponto
+        (-1 quando está fora de todas) e a distância em metros até a borda da cerca
+        mais próxima (0 dentro de uma cerca; NaN sem cercas ou coordenada inválida).
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    fence_index = np.full(len(lats), -1, dtype=int)
+    distance_m = np.full(len(lats), np.nan)
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    if not fences or not valid.any():
+        return fence_index, distance_m
+
+    # Filtro espacial: só os pontos dentro do retângulo envolvente passam pelo teste exato.
+    bbox = np.array([fence["bbox"] for fence in fences])
+    candidates = (
+        valid[:, None]
+        & (lats[:, None] >= bbox[:, 0]) & (lats[:, None] <= bbox[:, 1])
+        & (lons[:, None] >= bbox[:, 2]) & (lons[:, None] <= bbox[:, 3])
+    )
+    for i, fence in enumerate(fences):
+        idx = np.flatnonzero(candidates[:, i] & (fence_index < 0))
+        if not len(idx):
+            continue
+        if fence["type"] == "polygon":
+            inside = points_in_polygon(lats[idx], lons[idx], fence["lats"], fence["lons"])
+        else:
+            inside = geo_util.haversine_distances(lats[idx], lons[idx], fence["latitude"], fence["longitude"]) <= fence["radius_meters"]
+        fence_index[idx[inside]] = i
+
+    distance_m[valid & (fence_index >= 0)] = 0.0
+    outside = np.flatnonzero(valid & (fence_index < 0))
+    if len(outside):
+        per_fence = []
+        for fence in fences:
+            if fence["type"] == "polygon":
+                per_fence.append(distances_to_polygon(lats[outside], lons[outside], fence["lats"], fence["lons"]))
+            else:
+                center = geo_util.haversine_distances(lats[outside], lons[outside], fence["latitude"], fence["longitude"])
+                per_fence.append(np.maximum(center - fence["radius_meters"], 0.0))
+        distance_m[outside] = np.min(per_fence, axis=0)
+    return fence_index, distance_m
+
+def location_status(inside, fence_name, distance_m, has_fences=True):
+    """Texto de localização gravado no checklist a partir do resultado da classificação."""
+    if not has_fences:
+        return "Não verificado"
+    if distance_m is None or pd.isna(distance_m):
+        return "Coordenada Inválida"
+    if inside:
+        return f"Dentro da Base ({fence_name})" if fence_name else "Dentro da Base"
+    return f"Fora da Base ({int(distance_m)}m)"
+
+def classify_fleet(fleet, fences):
+    """
+    Classifica toda a frota (tabela de `fleet_util.build_fleet_frame`) contra as
+    cercas em uma única chamada. Retorna, por placa, latitude, longitude, cerca
+    (nome ou None), distância até a cerca mais próxima e o status de localização.
+    """
+    compiled = compile_fences(fences)
+    fence_index, distance_m = classify_points(fleet["latitude"].to_numpy(), fleet["longitude"].to_numpy(), compiled)
+    names = np.array([fence["name"] for fence in compiled] + [None], dtype=object)
+    result = pd.DataFrame({
+        "latitude": fleet["latitude"].to_numpy(), "longitude": fleet["longitude"].to_numpy(),
+        "fence": pd.Series(names[fence_index], index=fleet.index, dtype="object"), "distance_m": distance_m,
+    }, index=fleet.index)
+    result["inside"] = fence_index >= 0
+    result["location_status"] = [
+        location_status(inside, name, dist, bool(compiled)) for inside, name, dist in zip(result["inside"], result["fence"], result["distance_m"])
+    ]
+    return result
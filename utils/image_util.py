@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# Limites das fotos dos checklists.
+PHOTO_MAX_SIZE = (1600, 1600)
+PHOTO_QUALITY = 80
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 70
+
+def _encode_jpeg(img, quality):
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    buf.seek(0)
+    return buf
+
+def prepare_photo(file):
+    """
+    Reencoda a foto em JPEG com resolução e qualidade limitadas e gera uma miniatura.
+    Retorna (foto, miniatura) como BytesIO; se a imagem não puder ser lida,
+    retorna o arquivo original e None.
+    """
+    try:
+        file.seek(0)
+        with Image.open(file) as original:
+            img = ImageOps.exif_transpose(original).convert("RGB")
+        img.thumbnail(PHOTO_MAX_SIZE, Image.LANCZOS)
+        photo = _encode_jpeg(img, PHOTO_QUALITY)
+        img.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+        thumbnail = _encode_jpeg(img, THUMBNAIL_QUALITY)
+        return photo, thumbnail
+    except Exception as e:
+        print(f"Falha ao processar imagem, enviando original: {e}")
+        file.seek(0)
+        return file, None